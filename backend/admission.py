@@ -0,0 +1,132 @@
+# admission control for the API: a cap on in-flight requests per worker process
+#
+# Requests over the cap are turned away right away with 503 and Retry-After
+# instead of queueing until the client times out. Only POST requests (the ones
+# that call providers) count; health checks, stats and job polls always get through.
+import os
+import time
+import json
+import logging
+import threading
+
+from dotenv import load_dotenv
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# POST requests served at once by one worker process
+MAX_IN_FLIGHT_REQUESTS = int(os.getenv("MAX_IN_FLIGHT_REQUESTS", "32"))
+# seconds clients are asked to wait when the worker is full
+OVERLOAD_RETRY_AFTER = int(os.getenv("OVERLOAD_RETRY_AFTER", "5"))
+
+_in_flight = 0
+_draining = False
+_counters = {"admitted": 0, "rejected": 0}
+_condition = threading.Condition()
+
+
+def try_acquire():
+    """
+    Returns:
+        bool: Whether a request may start; call release() when it is done
+    """
+    global _in_flight
+    with _condition:
+        if _draining or _in_flight >= MAX_IN_FLIGHT_REQUESTS:
+            _counters["rejected"] += 1
+            return False
+        _in_flight += 1
+        _counters["admitted"] += 1
+        return True
+
+
+def release():
+    global _in_flight
+    with _condition:
+        _in_flight -= 1
+        _condition.notify_all()
+
+
+def ready():
+    """
+    Returns:
+        bool: Whether this worker accepts new requests
+    """
+    with _condition:
+        return not _draining and _in_flight < MAX_IN_FLIGHT_REQUESTS
+
+
+def drain(timeout):
+    """
+    Stop admitting requests and wait for the in-flight ones to finish.
+    Args:
+        timeout (float): Seconds to wait at most
+    Returns:
+        bool: Whether every in-flight request finished in time
+    """
+    global _draining
+    deadline = time.monotonic() + timeout
+    with _condition:
+        _draining = True
+        while _in_flight and time.monotonic() < deadline:
+            _condition.wait(deadline - time.monotonic())
+        if _in_flight:
+            logger.warning(f"{_in_flight} requests still in flight after {timeout}s")
+        return _in_flight == 0
+
+
+def stats():
+    """
+    Returns:
+        dict: In-flight requests, the cap, admission counters and whether the worker is draining
+    """
+    with _condition:
+        stats = dict(_counters)
+        stats["in_flight"] = _in_flight
+        stats["max_in_flight"] = MAX_IN_FLIGHT_REQUESTS
+        stats["draining"] = _draining
+        return stats
+
+
+class _ReleasingIterable:
+    # releases the slot once a (possibly streamed) response has been sent or abandoned
+    def __init__(self, iterable):
+        self._iterable = iterable
+
+    def __iter__(self):
+        return iter(self._iterable)
+
+    def close(self):
+        try:
+            if hasattr(self._iterable, "close"):
+                self._iterable.close()
+        finally:
+            release()
+
+
+class AdmissionMiddleware:
+    """
+    WSGI middleware applying the in-flight cap to POST requests.
+    """
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        if environ.get("REQUEST_METHOD") != "POST":
+            return self.wsgi_app(environ, start_response)
+        if not try_acquire():
+            body = json.dumps({"error": "Server is at capacity, try again later"}).encode()
+            start_response("503 Service Unavailable", [
+                ("Content-Type", "application/json"),
+                ("Content-Length", str(len(body))),
+                ("Retry-After", str(OVERLOAD_RETRY_AFTER)),
+                # answered before flask-cors sees the request; browsers still need to read it
+                ("Access-Control-Allow-Origin", "*"),
+            ])
+            return [body]
+        try:
+            return _ReleasingIterable(self.wsgi_app(environ, start_response))
+        except BaseException:
+            release()
+            raise
@@ -0,0 +1,131 @@
+# parser for the "(x of N Model)" support annotations in variation-aware summaries
+import re
+
+# how models are named in the annotations
+MODEL_NAMES = {"gpt": "GPT", "claude": "Claude", "gemini": "Gemini"}
+
+# any innermost parenthesized group; only those made of support items are annotations
+PARENTHESES_PATTERN = re.compile(r"\(([^()]*)\)")
+SUPPORT_ITEM = r"(\d+)\s*(?:of|/)\s*\d+\s+([A-Za-z][\w.-]*)"
+SUPPORT_ITEM_PATTERN = re.compile(SUPPORT_ITEM)
+ANNOTATION_PATTERN = re.compile(rf"\s*{SUPPORT_ITEM}(?:\s*(?:,|;|\band\b)\s*{SUPPORT_ITEM})*\s*")
+HEADING_PATTERN = re.compile(r"^\s*#+\s*(.*?)\s*$", re.MULTILINE)
+# list markers, emphasis and joining punctuation around a claim
+CLAIM_MARKUP_PATTERN = re.compile(r"^[\s*_#:;,.\-•]+|[\s*_:;,\-•]+$|\*\*|__")
+
+
+def model_id(name):
+    """
+    Args:
+        name (str): A model name as written in an annotation, e.g. "GPT" or "Gemini-2.5"
+    Returns:
+        str: The model id ("gpt", "claude", "gemini"), or the lower-cased name if unknown
+    """
+    name = name.lower()
+    for model in MODEL_NAMES:
+        if name.startswith(model):
+            return model
+    return name
+
+
+def format_annotation(support, num_trials, models):
+    """
+    Args:
+        support (dict): model -> number of descriptions stating a claim
+        num_trials (int): Number of trials
+        models (list): List of models, in annotation order
+    Returns:
+        str: e.g. "(2 of 3 GPT, 3 of 3 Claude)"
+    """
+    parts = [f"{support[m]} of {num_trials} {MODEL_NAMES.get(m, m)}" for m in models if support.get(m)]
+    return f"({', '.join(parts)})"
+
+
+def parse_summary(text, num_trials, models):
+    """
+    Split an annotated summary into segments in a single pass. Every annotation
+    closes a claim: the text since the previous annotation. Parentheses that are
+    not annotations stay part of the text.
+    Args:
+        text (str): The variation-aware summary
+        num_trials (int): Number of trials
+        models (list): Models used, which set the denominator of the percentages
+    Returns:
+        dict: {"numTrials", "models", "segments"}. Concatenating the segments' "text"
+            and "annotation" fields gives back the summary. Annotated segments also
+            carry "claim" (text without markup), "section" (the enclosing heading),
+            "support" ({model: descriptions}), "mentions" and "percentage".
+    """
+    total_possible = len(models) * int(num_trials)
+    headings = [(m.start(), m.group(1)) for m in HEADING_PATTERN.finditer(text)]
+    segments = []
+    position = 0
+    heading_index = 0
+    section = None
+    for match in PARENTHESES_PATTERN.finditer(text):
+        if not ANNOTATION_PATTERN.fullmatch(match.group(1)):
+            continue
+        support = {}
+        for count, name in SUPPORT_ITEM_PATTERN.findall(match.group(1)):
+            model = model_id(name)
+            support[model] = support.get(model, 0) + int(count)
+        while heading_index < len(headings) and headings[heading_index][0] < match.start():
+            section = headings[heading_index][1]
+            heading_index += 1
+        mentions = sum(support.values())
+        claim_text = text[position:match.start()]
+        segments.append({
+            "text": claim_text,
+            "annotation": match.group(0),
+            # the claim is the last line before the annotation
+            "claim": CLAIM_MARKUP_PATTERN.sub("", claim_text.rsplit("\n", 1)[-1]),
+            "section": section,
+            "support": support,
+            "mentions": mentions,
+            "percentage": round(mentions / total_possible * 100) if total_possible else None,
+        })
+        position = match.end()
+    if position < len(text):
+        segments.append({"text": text[position:], "annotation": ""})
+    return {"numTrials": int(num_trials), "models": list(models), "segments": segments}
+
+
+def support_label(percentage):
+    """
+    Args:
+        percentage (int): Share of all descriptions stating a claim
+    Returns:
+        str: A natural-language support level
+    """
+    if percentage >= 75:
+        return "well-supported"
+    elif percentage >= 50:
+        return "moderately supported"
+    elif percentage >= 25:
+        return "weakly supported"
+    return "very little support"
+
+
+def render_views(parsed, views=("var_only", "percentage", "nl")):
+    """
+    Args:
+        parsed (dict): The result of parse_summary
+        views (iterable): Which of the views below to render
+    Returns:
+        dict: {"var_only", "percentage", "nl"}: the summary without annotations,
+            with the share of descriptions, and with a support level per claim
+    """
+    rendered = {view: [] for view in ("var_only", "percentage", "nl") if view in views}
+    for segment in parsed["segments"]:
+        text = segment["text"]
+        if "support" not in segment or segment["percentage"] is None:
+            for parts in rendered.values():
+                parts.append(text + segment["annotation"])
+            continue
+        if "var_only" in rendered:
+            rendered["var_only"].append(text.rstrip(" \t"))
+        if "percentage" in rendered:
+            rendered["percentage"].append(f"{text}({segment['percentage']}%)")
+        if "nl" in rendered:
+            rendered["nl"].append(f"{text}({support_label(segment['percentage'])})")
+    return {view: "".join(parts) for view, parts in rendered.items()}
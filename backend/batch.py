@@ -0,0 +1,206 @@
+# offline batch runner for image corpora
+#
+#   python batch.py INPUT OUTPUT_DIR [--trials 3] [--models gpt,claude,gemini] [--images 16]
+#
+# INPUT is a directory of images or a JSONL manifest with one object per line, using
+# the fields of the examples' metadata.json ("image", "prompt", "numTrials",
+# "selectedModels", "promptVariation", "source", plus an optional "name").
+# Each image gets OUTPUT_DIR/<name>/ with descriptions.json, metadata.json and
+# summary.json, in the layout of frontend/public/examples/*.
+#
+# Re-running the same command resumes: finished images are skipped, images whose
+# descriptions are done only get their summary, and provider calls that completed
+# before the interruption are served from the on-disk description cache.
+import os
+import sys
+import json
+import logging
+import argparse
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".gif")
+DEFAULT_PROMPT = "Describe the image in detail."
+# summary renderings saved in summary.json, as in the examples
+SUMMARY_VIEWS = ("model_diff", "var_only", "percentage", "nl")
+
+logger = logging.getLogger("batch")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate descriptions and summaries for a corpus of images")
+    parser.add_argument("input", help="directory of images or JSONL manifest")
+    parser.add_argument("output", help="directory to write one result folder per image into")
+    parser.add_argument("--prompt", default=DEFAULT_PROMPT, help="prompt for images without one")
+    parser.add_argument("--trials", type=int, default=3, help="trials per model for images without numTrials")
+    parser.add_argument("--models", default="gpt,claude,gemini", help="models for images without selectedModels")
+    parser.add_argument("--variation", default="original", help="prompt variation for images without promptVariation")
+    parser.add_argument("--summary-mode", default="single", help="single, mapreduce or local")
+    parser.add_argument("--no-summary", action="store_true", help="only generate descriptions")
+    parser.add_argument("--images", type=int, default=16, help="images processed at once")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="provider calls in flight across all images (MAX_CONCURRENT_CALLS)")
+    parser.add_argument("--cache-dir", default=None,
+                        help="on-disk description cache used to resume (default: OUTPUT/.cache)")
+    return parser.parse_args(argv)
+
+
+def load_items(path, defaults):
+    """
+    Args:
+        path (str): Directory of images or JSONL manifest
+        defaults (dict): metadata.json fields for items that do not set them
+    Returns:
+        list: (name, metadata) pairs, one per image
+    """
+    items = []
+    if os.path.isdir(path):
+        for file_name in sorted(os.listdir(path)):
+            if file_name.lower().endswith(IMAGE_EXTENSIONS):
+                items.append(dict(defaults, image=os.path.join(path, file_name), source="file"))
+    else:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    items.append(dict(defaults, **json.loads(line)))
+
+    named = []
+    seen = set()
+    for index, item in enumerate(items, 1):
+        name = item.pop("name", None) or _default_name(item, index)
+        if name in seen:
+            name = f"{name}-{index}"
+        seen.add(name)
+        if "source" not in item or item["source"] is None:
+            item["source"] = "url" if item["image"].startswith(("http://", "https://")) else "file"
+        named.append((name, item))
+    return named
+
+
+def _default_name(item, index):
+    if item.get("source") == "file" or not item["image"].startswith(("http://", "https://", "data:")):
+        return os.path.splitext(os.path.basename(item["image"]))[0]
+    return f"{index:05d}"
+
+
+def image_input(metadata):
+    """
+    Args:
+        metadata (dict): The image's metadata
+    Returns:
+        tuple: (image, source) as expected by pipeline.variation_generation
+    """
+    if metadata["source"] != "file":
+        return metadata["image"], metadata["source"]
+    import imaging
+
+    media_type = (mimetypes.guess_type(metadata["image"])[0] or "image/jpeg").split("/")[-1]
+    with open(metadata["image"], "rb") as f:
+        return imaging.ImageHandle(f.read(), media_type), "upload"
+
+
+def write_json(path, data):
+    # write-then-rename, so an interrupted run never leaves a truncated checkpoint
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp, path)
+
+
+def read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def has_errors(descs):
+    return any(str(v.get("description", "")).startswith("Error:") for k, v in descs.items() if k != "prompt")
+
+
+def process_image(name, metadata, output_dir, args):
+    """
+    Generate (or resume) one image's descriptions and summary.
+    Returns:
+        str: "skipped", "done" or "incomplete" (some provider calls failed)
+    """
+    # imported here so main can configure the backend through the environment first
+    import pipeline
+
+    folder = os.path.join(output_dir, name)
+    os.makedirs(folder, exist_ok=True)
+    descriptions_path = os.path.join(folder, "descriptions.json")
+    summary_path = os.path.join(folder, "summary.json")
+
+    descs = read_json(descriptions_path)
+    complete = descs is not None and not has_errors(descs)
+    if complete and (args.no_summary or os.path.exists(summary_path)):
+        return "skipped"
+
+    write_json(os.path.join(folder, "metadata.json"), metadata)
+    num_trials = int(metadata["numTrials"])
+    models = metadata["selectedModels"]
+    if not complete:
+        image, source = image_input(metadata)
+        # completed calls of an interrupted run are description cache hits
+        descs = pipeline.variation_generation(
+            image, num_trials, models, metadata["promptVariation"], metadata["prompt"], source=source
+        )
+        write_json(descriptions_path, descs)
+        # reload so ids are strings, as they are when resuming from the checkpoint
+        descs = read_json(descriptions_path)
+        if has_errors(descs):
+            return "incomplete"
+
+    if not args.no_summary:
+        summary = pipeline.aggregated_description_generation(
+            descs, folder, num_trials, models, summary_mode=metadata.get("summaryMode", args.summary_mode),
+            views=SUMMARY_VIEWS,
+        )
+        write_json(summary_path, summary)
+    return "done"
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+
+    # configure the caches and the runtime before the backend modules read their settings
+    os.makedirs(args.output, exist_ok=True)
+    if args.cache_dir:
+        os.environ["DESCRIPTION_CACHE_DIR"] = args.cache_dir
+    os.environ.setdefault("DESCRIPTION_CACHE_DIR", os.path.join(args.output, ".cache"))
+    if args.concurrency:
+        os.environ["MAX_CONCURRENT_CALLS"] = str(args.concurrency)
+
+    defaults = {
+        "prompt": args.prompt,
+        "numTrials": args.trials,
+        "selectedModels": [m.strip() for m in args.models.split(",") if m.strip()],
+        "promptVariation": args.variation,
+        "source": None,
+    }
+    items = load_items(args.input, defaults)
+    logger.info(f"{len(items)} images, {args.images} at a time")
+
+    counts = {"done": 0, "skipped": 0, "incomplete": 0, "failed": 0}
+    with ThreadPoolExecutor(max_workers=args.images, thread_name_prefix="batch") as executor:
+        futures = {executor.submit(process_image, name, metadata, args.output, args): name for name, metadata in items}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                status = future.result()
+            except Exception as e:
+                logger.exception(f"{name} failed: {e}")
+                status = "failed"
+            counts[status] += 1
+            logger.info(f"[{sum(counts.values())}/{len(items)}] {name}: {status}")
+
+    print(json.dumps(counts, indent=4))
+    # anything not finished is picked up by running the same command again
+    return 1 if counts["incomplete"] or counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
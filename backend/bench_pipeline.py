@@ -0,0 +1,252 @@
+# pipeline benchmark against the local mock providers (mock_providers.py)
+#
+#   python bench_pipeline.py [--quick] [--latency 0.8] [--error-rate 0.0] [--output bench.json]
+#
+# Drives get_all_descriptions, aggregated_description_generation and the /generate
+# endpoint at varying trials, models and client concurrency, and reports throughput
+# and p50/p95/p99 latency per scenario as JSON. No live API is called, so the numbers
+# measure the backend's own overhead and concurrency behaviour.
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import itertools
+import subprocess
+import statistics
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import mock_providers
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+EXAMPLE_DIR = os.path.join(mock_providers.EXAMPLES_DIR, "card")
+
+TRIALS = [1, 3, 5]
+MODEL_SETS = [["gpt"], ["gpt", "claude", "gemini"]]
+CONCURRENCY = [1, 8, 32]
+SUMMARY_MODES = ["single", "local"]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline against mock providers")
+    parser.add_argument("--quick", action="store_true", help="one small configuration per scenario")
+    parser.add_argument("--requests", type=int, default=None, help="requests per client (default 3, 1 with --quick)")
+    parser.add_argument("--latency", type=float, default=0.8, help="median mock response time in seconds")
+    parser.add_argument("--sigma", type=float, default=0.5, help="spread of the log-normal mock latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of mock 500 responses")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of mock 429 responses")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--provider-rpm", type=float, default=None,
+                        help="per-provider request quota (RATE_LIMIT_RPM_*); by default the backend's own setting")
+    parser.add_argument("--scenarios", default="descriptions,summary,endpoint")
+    parser.add_argument("--output", default=None, help="also write the report to this file")
+    return parser.parse_args(argv)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_mock(args):
+    """
+    Run the mock providers in their own process, so they do not compete with the
+    backend for the GIL.
+    Returns:
+        tuple: (process, base url)
+    """
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "mock_providers.py", "--port", str(port), "--latency", str(args.latency),
+         "--sigma", str(args.sigma), "--error-rate", str(args.error_rate),
+         "--throttle-rate", str(args.throttle_rate), "--seed", str(args.seed)],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            urllib.request.urlopen(f"{base_url}/v1/models", timeout=1).read()
+            return process, base_url
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError("mock provider server did not start")
+            time.sleep(0.1)
+
+
+def summarize(latencies, wall_seconds, errors=0):
+    """
+    Args:
+        latencies (list): Seconds per request
+        wall_seconds (float): Wall time of the whole scenario
+        errors (int): Requests that failed or returned provider errors
+    Returns:
+        dict: Request count, throughput and latency percentiles
+    """
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))], 4) if ordered else None
+
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(len(ordered) / wall_seconds, 3) if wall_seconds else None,
+        "mean": round(statistics.mean(ordered), 4) if ordered else None,
+        "p50": percentile(50),
+        "p95": percentile(95),
+        "p99": percentile(99),
+    }
+
+
+def drive(fn, concurrency, requests_per_client):
+    """
+    Call fn from `concurrency` client threads, `requests_per_client` times each.
+    Args:
+        fn (callable): Runs one request; returns True if it failed
+    Returns:
+        dict: See summarize
+    """
+    def client(_):
+        results = []
+        for _ in range(requests_per_client):
+            started = time.perf_counter()
+            try:
+                failed = fn()
+            except Exception:
+                failed = True
+            results.append((time.perf_counter() - started, failed))
+        return results
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = [r for rs in executor.map(client, range(concurrency)) for r in rs]
+    wall = time.perf_counter() - started
+    return summarize([r[0] for r in results], wall, sum(1 for r in results if r[1]))
+
+
+def has_errors(descs):
+    return any(str(v.get("description", "")).startswith("Error:") for k, v in descs.items() if k != "prompt")
+
+
+def load_example():
+    with open(os.path.join(EXAMPLE_DIR, "descriptions.json")) as f:
+        descs = json.load(f)
+    with open(os.path.join(EXAMPLE_DIR, "metadata.json")) as f:
+        metadata = json.load(f)
+    return descs, metadata
+
+
+def bench_descriptions(image, grid, requests_per_client):
+    import generation
+
+    report = []
+    for trials, models, concurrency in grid:
+        def run():
+            return has_errors(generation.get_all_descriptions(
+                image, "Describe the image in detail.", trials, models, "original", "url", use_cache=False
+            ))
+        result = drive(run, concurrency, requests_per_client)
+        report.append(dict({"trials": trials, "models": models, "concurrency": concurrency}, **result))
+        print(f"descriptions trials={trials} models={','.join(models)} concurrency={concurrency}: "
+              f"{result['throughput_rps']} req/s, p50 {result['p50']}s, p99 {result['p99']}s", file=sys.stderr)
+    return report
+
+
+def bench_summary(modes, concurrencies, requests_per_client):
+    import pipeline
+
+    descs, metadata = load_example()
+    report = []
+    for mode, concurrency in itertools.product(modes, concurrencies):
+        def run():
+            summary = pipeline.aggregated_description_generation(
+                descs, None, metadata["numTrials"], metadata["selectedModels"], summary_mode=mode
+            )
+            return not summary.get("model_diff")
+        result = drive(run, concurrency, requests_per_client)
+        report.append(dict({"summary_mode": mode, "concurrency": concurrency}, **result))
+        print(f"summary mode={mode} concurrency={concurrency}: "
+              f"{result['throughput_rps']} req/s, p50 {result['p50']}s, p99 {result['p99']}s", file=sys.stderr)
+    return report
+
+
+def bench_endpoint(image, grid, requests_per_client):
+    import main
+
+    client = main.app.test_client()
+    report = []
+    for trials, models, concurrency in grid:
+        body = {
+            "image": image, "prompt": "Describe the image in detail.", "numTrials": trials,
+            "selectedModels": models, "promptVariation": "original", "source": "url", "bypassCache": True,
+        }
+
+        def run():
+            response = client.post("/generate", json=body)
+            return response.status_code != 200 or has_errors(response.get_json()["descriptions"])
+        result = drive(run, concurrency, requests_per_client)
+        report.append(dict({"trials": trials, "models": models, "concurrency": concurrency}, **result))
+        print(f"/generate trials={trials} models={','.join(models)} concurrency={concurrency}: "
+              f"{result['throughput_rps']} req/s, p50 {result['p50']}s, p99 {result['p99']}s", file=sys.stderr)
+    return report
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    requests_per_client = args.requests or (1 if args.quick else 3)
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+
+    process, base_url = start_mock(args)
+    try:
+        # point the backend at the mock and turn off every cache before it reads its settings
+        os.environ.update(mock_providers.environment(base_url))
+        os.environ.update({
+            "WARM_UP_CLIENTS": "0", "SUMMARY_CACHE_SIZE": "0", "DESCRIPTION_CACHE_SIZE": "0",
+            "VARIATION_CACHE_SIZE": "0",
+        })
+        if args.provider_rpm is not None:
+            for provider in ("OPENAI", "GEMINI", "CLAUDE"):
+                os.environ[f"RATE_LIMIT_RPM_{provider}"] = str(args.provider_rpm)
+        os.environ.pop("DESCRIPTION_CACHE_DIR", None)
+        image = f"{base_url}/image.png"
+
+        if args.quick:
+            grid = [(3, ["gpt", "claude", "gemini"], 8)]
+            modes, concurrencies = SUMMARY_MODES, [8]
+        else:
+            grid = list(itertools.product(TRIALS, MODEL_SETS, CONCURRENCY))
+            modes, concurrencies = SUMMARY_MODES, CONCURRENCY
+
+        report = {
+            "mock": {"latency": args.latency, "sigma": args.sigma, "error_rate": args.error_rate,
+                     "throttle_rate": args.throttle_rate, "seed": args.seed},
+            "requests_per_client": requests_per_client,
+        }
+        if "descriptions" in scenarios:
+            report["descriptions"] = bench_descriptions(image, grid, requests_per_client)
+        if "summary" in scenarios:
+            report["summary"] = bench_summary(modes, concurrencies, requests_per_client)
+        if "endpoint" in scenarios:
+            report["endpoint"] = bench_endpoint(image, grid, requests_per_client)
+        with urllib.request.urlopen(f"{base_url}/mock/stats", timeout=5) as response:
+            report["mock"]["calls"] = json.loads(response.read())
+    finally:
+        process.terminate()
+        process.wait()
+
+    output = json.dumps(report, indent=4)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
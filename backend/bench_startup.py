@@ -0,0 +1,76 @@
+# cold-start benchmark: import time and baseline RSS of the backend
+#
+#   python bench_startup.py [--runs 5] [--budget-seconds 1.0] [--budget-mb 120]
+#
+# Exits with status 1 if the median import time or RSS is over budget, or if
+# a heavy library is imported at start-up instead of on first use.
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "1.0"))
+BUDGET_MB = float(os.getenv("STARTUP_BUDGET_MB", "120"))
+
+# libraries that must only be loaded on first use
+LAZY_MODULES = ["openai", "anthropic", "google.genai", "torch", "numpy", "PIL", "nltk", "requests", "prometheus_client", "opentelemetry"]
+
+PROBE = '''
+import sys, json, time, resource
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+# ru_maxrss is in bytes on macOS and kilobytes on Linux
+rss_mb = rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+print(json.dumps({"seconds": elapsed, "rss_mb": rss_mb, "loaded": [m for m in %r if m in sys.modules]}))
+''' % (LAZY_MODULES,)
+
+
+def measure(runs):
+    """
+    Args:
+        runs (int): Number of fresh interpreters to start
+    Returns:
+        list: One {"seconds", "rss_mb", "loaded"} dict per run
+    """
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, WARM_UP_CLIENTS="0")
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE], cwd=backend_dir, env=env, capture_output=True, text=True, check=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure backend cold-start cost")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-seconds", type=float, default=BUDGET_SECONDS)
+    parser.add_argument("--budget-mb", type=float, default=BUDGET_MB)
+    args = parser.parse_args()
+
+    results = measure(args.runs)
+    seconds = statistics.median(r["seconds"] for r in results)
+    rss_mb = statistics.median(r["rss_mb"] for r in results)
+    loaded = sorted({m for r in results for m in r["loaded"]})
+    print(json.dumps({"median_seconds": round(seconds, 3), "median_rss_mb": round(rss_mb, 1), "eagerly_loaded": loaded}, indent=4))
+
+    failures = []
+    if seconds > args.budget_seconds:
+        failures.append(f"import time {seconds:.3f}s is over the {args.budget_seconds}s budget")
+    if rss_mb > args.budget_mb:
+        failures.append(f"RSS {rss_mb:.1f} MB is over the {args.budget_mb} MB budget")
+    if loaded:
+        failures.append(f"{', '.join(loaded)} imported at start-up instead of on first use")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
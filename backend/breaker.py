@@ -0,0 +1,162 @@
+# circuit breakers for the OpenAI-compatible and native SDK paths of a provider
+#
+# Gemini and Claude are called through their OpenAI-compatible endpoint first and
+# fall back to the native SDK. A breaker per path counts consecutive failures; once
+# a path's breaker opens, calls go straight to the other path until the cool-down
+# ends and one probe call is let through (half-open) to see if the path recovered.
+#
+# route() makes a single attempt per path and runs inside ratelimit.call, which retries
+# the whole route; a failing path so costs one round trip before the next is tried.
+import os
+import time
+import asyncio
+import logging
+
+import ratelimit
+import tracing
+
+from dotenv import load_dotenv
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# consecutive failures that open a breaker, and seconds before it is probed again
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))
+
+# failures that say nothing about the path: bad keys and rate limits
+IGNORED_STATUSES = {401, 403, 429}
+# failures not sent on to the next path: both paths share the provider key's quota
+NO_FALLBACK_STATUSES = {429}
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+# state -> counter of transitions into it
+TRANSITIONS = {OPEN: "opened", HALF_OPEN: "half_opened", CLOSED: "closed"}
+
+
+class CircuitBreaker:
+    """
+    Breaker for one call path. Only used from the shared runtime loop.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.counters = {"opened": 0, "half_opened": 0, "closed": 0, "short_circuited": 0}
+
+    def _transition(self, state):
+        logger.info(f"Circuit breaker {self.name}: {self.state} -> {state}")
+        self.state = state
+        self.counters[TRANSITIONS[state]] += 1
+
+    def allow(self):
+        """
+        Returns:
+            bool: Whether a call may use this path now
+        """
+        if self.state == OPEN and time.monotonic() - self.opened_at >= BREAKER_COOLDOWN:
+            self._transition(HALF_OPEN)
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and not self.probing:
+            # a single probe call at a time checks whether the path recovered
+            self.probing = True
+            return True
+        self.counters["short_circuited"] += 1
+        return False
+
+    def success(self):
+        self.probing = False
+        self.failures = 0
+        if self.state != CLOSED:
+            self._transition(CLOSED)
+
+    def failure(self):
+        self.probing = False
+        self.failures += 1
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= BREAKER_FAILURES):
+            self.opened_at = time.monotonic()
+            self._transition(OPEN)
+
+    def abandon(self):
+        # the call was cancelled before it told us anything
+        self.probing = False
+
+    def stats(self):
+        """
+        Returns:
+            dict: State, consecutive failures and transition counts
+        """
+        stats = dict(self.counters)
+        stats["state"] = self.state
+        stats["consecutive_failures"] = self.failures
+        return stats
+
+
+# (provider, path) -> CircuitBreaker
+_breakers = {}
+
+
+def get_breaker(provider, path):
+    """
+    Args:
+        provider (str): "gemini" or "claude"
+        path (str): "compat" or "native"
+    Returns:
+        CircuitBreaker: The breaker shared by every call on this path
+    """
+    breaker = _breakers.get((provider, path))
+    if breaker is None:
+        breaker = _breakers[(provider, path)] = CircuitBreaker(f"{provider}/{path}")
+    return breaker
+
+
+async def route(provider, paths):
+    """
+    Try a provider's call paths in order, skipping those whose breaker is open.
+    Args:
+        provider (str): "gemini" or "claude"
+        paths (list): (path name, callable returning a new coroutine) pairs, preferred first
+    Returns:
+        The result of the first path that succeeds
+    Raises:
+        The last exception if every path that was tried failed, or a 429 at once
+    """
+    error = None
+    for index, (name, make_call) in enumerate(paths):
+        breaker = get_breaker(provider, name)
+        # with every breaker open, the last path is tried anyway rather than failing outright
+        if not breaker.allow() and (error is not None or index < len(paths) - 1):
+            continue
+        try:
+            result = await make_call()
+        except asyncio.CancelledError:
+            breaker.abandon()
+            raise
+        except Exception as e:
+            status = ratelimit.status_code(e)
+            if status in IGNORED_STATUSES:
+                breaker.abandon()
+            else:
+                breaker.failure()
+            if status in NO_FALLBACK_STATUSES:
+                # throttled: let ratelimit.call back off, rather than spend the same quota on the next path
+                raise
+            logger.info(f"{provider} {name} call failed: {e}")
+            error = e
+            continue
+        breaker.success()
+        tracing.annotate(path=name)
+        return result
+    raise error
+
+
+def stats():
+    """
+    Returns:
+        dict: Breaker stats per provider and path
+    """
+    return {breaker.name: breaker.stats() for breaker in list(_breakers.values())}
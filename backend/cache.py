@@ -0,0 +1,301 @@
+# content-addressed caches for provider results
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DESCRIPTION_CACHE_SIZE = int(os.getenv("DESCRIPTION_CACHE_SIZE", "2048"))
+DESCRIPTION_CACHE_TTL = float(os.getenv("DESCRIPTION_CACHE_TTL", str(7 * 24 * 3600)))
+# the on-disk tier is only enabled when a directory is configured
+DESCRIPTION_CACHE_DIR = os.getenv("DESCRIPTION_CACHE_DIR")
+DESCRIPTION_CACHE_MAX_MB = float(os.getenv("DESCRIPTION_CACHE_MAX_MB", "256"))
+VARIATION_CACHE_SIZE = int(os.getenv("VARIATION_CACHE_SIZE", "512"))
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "256"))
+SUMMARY_CACHE_TTL = float(os.getenv("SUMMARY_CACHE_TTL", str(24 * 3600)))
+
+
+def content_hash(*parts):
+    """
+    Args:
+        *parts: JSON-serializable values
+    Returns:
+        str: sha256 hex digest of the canonical JSON encoding of parts
+    """
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory cache bounded by entry count and optionally by total size,
+    with optional TTL.
+    """
+
+    def __init__(self, max_entries, ttl=None, max_bytes=None, sizeof=None):
+        """
+        Args:
+            max_entries (int): Entries kept at most
+            ttl (float, optional): Seconds an entry stays valid
+            max_bytes (int, optional): Total size kept at most, as measured by sizeof
+            sizeof (callable, optional): Returns the size of a value in bytes; required with max_bytes
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, created, size = entry
+            if self.ttl is not None and time.time() - created > self.ttl:
+                del self._entries[key]
+                self.bytes -= size
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[2]
+            self._entries[key] = (value, time.time(), size)
+            self.bytes += size
+            # a value larger than max_bytes evicts everything, itself included
+            while self._entries and (len(self._entries) > self.max_entries
+                                     or (self.max_bytes is not None and self.bytes > self.max_bytes)):
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskCache:
+    """
+    SQLite-backed cache of JSON values with TTL and a total size bound.
+    Least recently accessed entries are evicted first. Several processes may share
+    the file: the size bound is checked against the table in each write transaction.
+    """
+
+    def __init__(self, path, max_bytes, ttl=None):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # autocommit; set() opens its own write transaction
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT, size INTEGER, created REAL, accessed REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            if self.ttl is not None and now - created > self.ttl:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            self._db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def set(self, key, value):
+        now = time.time()
+        value = json.dumps(value)
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so no other process writes
+            # between the size check and the eviction
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                    (key, value, len(value), now, now),
+                )
+                total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+                if total > self.max_bytes:
+                    self._evict(total)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _evict(self, total):
+        # trim to 90% of the budget so eviction does not run on every write
+        target = self.max_bytes * 0.9
+        rows = self._db.execute("SELECT key, size FROM entries ORDER BY accessed").fetchall()
+        for key, size in rows:
+            if total <= target:
+                break
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+class TieredCache:
+    """
+    In-memory LRU in front of an optional on-disk tier, with hit/miss counters.
+    """
+
+    def __init__(self, name, max_entries, ttl=None, disk_dir=None, disk_max_mb=256):
+        self.name = name
+        self.memory = LRUCache(max_entries, ttl)
+        self.disk = None
+        if disk_dir:
+            self.disk = DiskCache(os.path.join(disk_dir, f"{name}.sqlite3"), int(disk_max_mb * 1024 * 1024), ttl)
+        self._lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0}
+
+    def _count(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("memory_hits")
+            return value
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self._count("disk_hits")
+                self.memory.set(key, value)
+                return value
+        self._count("misses")
+        return None
+
+    def set(self, key, value):
+        self._count("writes")
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    async def aget(self, key):
+        """
+        get() for coroutines on the shared loop: the SQLite tier is read in a worker thread.
+        """
+        if self.disk is None:
+            return self.get(key)
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("memory_hits")
+            return value
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key, value):
+        """
+        set() for coroutines on the shared loop: the SQLite tier is written in a worker thread.
+        """
+        if self.disk is None:
+            self.set(key, value)
+            return
+        self._count("writes")
+        self.memory.set(key, value)
+        await asyncio.to_thread(self.disk.set, key, value)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Hit/miss counters, hit ratio, sizes and evictions per tier
+        """
+        with self._lock:
+            stats = dict(self.counters)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        stats["memory_entries"] = len(self.memory)
+        stats["memory_evictions"] = self.memory.evictions
+        if self.disk is not None:
+            stats["disk_entries"] = len(self.disk)
+            stats["disk_evictions"] = self.disk.evictions
+        return stats
+
+
+# (image hash, prompt, model, trial, variation type) -> {"description", "prompt"}
+description_cache = TieredCache(
+    "descriptions",
+    DESCRIPTION_CACHE_SIZE,
+    ttl=DESCRIPTION_CACHE_TTL,
+    disk_dir=DESCRIPTION_CACHE_DIR,
+    disk_max_mb=DESCRIPTION_CACHE_MAX_MB,
+)
+
+
+# (prompt, n, variation type) -> list of prompt variations
+variation_cache = TieredCache("variations", VARIATION_CACHE_SIZE, ttl=DESCRIPTION_CACHE_TTL)
+
+
+# canonical descriptions, num_trials, models -> {"model_diff": str, "analysis": dict}
+summary_cache = TieredCache("summaries", SUMMARY_CACHE_SIZE, ttl=SUMMARY_CACHE_TTL)
+
+
+def description_key(image_hash, prompt, model, trial, variation_type):
+    """
+    Args:
+        image_hash (str): Hash of the image content
+        prompt (str): The user's prompt (before any variation)
+        model (str): Model id ("gpt", "claude", "gemini")
+        trial (int): 1-based trial index
+        variation_type (str): Prompt variation type
+    Returns:
+        str: The cache key for one description
+    """
+    return content_hash("description", image_hash, prompt, model, trial, variation_type)
+
+
+def summary_key(descs, num_trials, models, summary_mode="single"):
+    """
+    Args:
+        descs (dict): Descriptions generated by get_all_descriptions
+        num_trials (int): Number of trials
+        models (list): List of models used
+        summary_mode (str): How the summary is generated
+    Returns:
+        str: The cache key for the variation-aware summary of descs.
+            Prompts are ignored, so reruns with the same descriptions share a key.
+    """
+    canonical = {
+        str(k): {field: value for field, value in v.items() if field != "prompt"}
+        for k, v in descs.items() if k != "prompt"
+    }
+    return content_hash("summary", canonical, int(num_trials), list(models), summary_mode)
+
+
+def stats():
+    """
+    Returns:
+        dict: Stats for every cache in this module
+    """
+    return {
+        "descriptions": description_cache.stats(),
+        "variations": variation_cache.stats(),
+        "summaries": summary_cache.stats(),
+    }
@@ -0,0 +1,286 @@
+# record / replay of provider HTTP traffic, for load tests and offline debugging
+#
+#   CASSETTE_MODE=record CASSETTE_DIR=./cassettes python main.py   # real providers, responses saved
+#   CASSETTE_MODE=replay CASSETTE_DIR=./cassettes python main.py   # no network, no keys needed
+#
+# Every SDK client built by clients.py (descriptions, prompt variations, summaries
+# and analysis) sends its requests through CassetteTransport. Requests are keyed by
+# method, URL (without API keys) and canonical JSON body; headers, and so the API keys,
+# are not part of the key and are never written. Identical requests (e.g. the trials of
+# an "original" run) keep every recorded response and replay them in order, wrapping
+# around when a load test sends more than were recorded. Replayed responses wait for the
+# latency observed while recording, times CASSETTE_LATENCY_SCALE (0 answers at once).
+#
+# Each key has a JSON lines file, <key>.jsonl: the request first, then one line per
+# response, appended as it is recorded.
+import os
+import json
+import time
+import base64
+import asyncio
+import logging
+import threading
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+import cache
+
+from dotenv import load_dotenv
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# "record", "replay", or empty to talk to the providers directly
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "").lower()
+CASSETTE_DIR = os.getenv("CASSETTE_DIR", "./cassettes")
+CASSETTE_LATENCY_SCALE = float(os.getenv("CASSETTE_LATENCY_SCALE", "1"))
+# stand-in key for providers without one in replay mode; the SDKs refuse to start without a key
+REPLAY_KEY = "cassette-replay"
+
+# query parameters carrying credentials
+SECRET_PARAMS = {"key", "api_key"}
+# response headers describing the encoding of the body as received, not as replayed
+HOP_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive", "set-cookie"}
+# longer strings (base64 images) are shortened in the request saved next to the responses
+MAX_SAVED_STRING = 1000
+
+# key -> {"request": ..., "responses": [...]}, loaded from CASSETTE_DIR on first use
+_entries = {}
+# key -> index of the next response to replay
+_cursors = {}
+_counters = {"recorded": 0, "replayed": 0, "misses": 0}
+_lock = threading.Lock()
+
+if CASSETTE_MODE not in ("", "record", "replay"):
+    raise ValueError(f"CASSETTE_MODE must be record or replay, not {CASSETTE_MODE!r}")
+
+
+class CassetteMiss(Exception):
+    """
+    A request has no recorded response in replay mode.
+    """
+
+
+def request_key(request):
+    """
+    Args:
+        request (httpx.Request): A request about to be sent
+    Returns:
+        tuple: (key, summary) with the cassette key and a readable, secret-free
+            description of the request
+    """
+    url = urlsplit(str(request.url))
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(url.query) if k not in SECRET_PARAMS))
+    normalized_url = f"{url.scheme}://{url.netloc}{url.path}" + (f"?{query}" if query else "")
+    content = request.content
+    try:
+        body = json.loads(content) if content else None
+    except ValueError:
+        body = {"sha256": cache.content_hash(base64.b64encode(content).decode())}
+    key = cache.content_hash("cassette", request.method, normalized_url, body)
+    return key, {"method": request.method, "url": normalized_url, "body": _shorten(body)}
+
+
+def _shorten(value):
+    if isinstance(value, str) and len(value) > MAX_SAVED_STRING:
+        return f"{value[:64]}... ({len(value)} chars, sha256 {cache.content_hash(value)[:16]})"
+    if isinstance(value, dict):
+        return {k: _shorten(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_shorten(v) for v in value]
+    return value
+
+
+def _path(key):
+    return os.path.join(CASSETTE_DIR, f"{key}.jsonl")
+
+
+def _load(key):
+    # callers hold _lock
+    entry = _entries.get(key)
+    if entry is None:
+        try:
+            with open(_path(key)) as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return None
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # the last line of a recording that was cut off
+                logger.warning(f"Skipping an unreadable line in {_path(key)}")
+        if not records:
+            return None
+        entry = _entries[key] = {"request": records[0]["request"], "responses": records[1:]}
+    return entry
+
+
+def record(key, summary, status, headers, body, latency):
+    """
+    Append a response to the cassette and to the key's file. Blocking; the async
+    transport calls it in a worker thread.
+    Args:
+        key (str): See request_key
+        summary (dict): See request_key
+        status (int): HTTP status of the response
+        headers (httpx.Headers): Response headers
+        body (bytes): The decoded response body
+        latency (float): Seconds from sending the request to reading the whole response
+    """
+    try:
+        saved_body, encoding = body.decode(), "utf-8"
+    except UnicodeDecodeError:
+        saved_body, encoding = base64.b64encode(body).decode(), "base64"
+    response = {
+        "status": status,
+        "headers": [[k, v] for k, v in headers.items() if k.lower() not in HOP_HEADERS],
+        "body": saved_body,
+        "encoding": encoding,
+        "latency": round(latency, 4),
+    }
+    lines = [json.dumps(response)]
+    # the lock keeps the file in the same order as the responses held in memory
+    with _lock:
+        entry = _load(key)
+        if entry is None:
+            entry = _entries[key] = {"request": summary, "responses": []}
+            lines.insert(0, json.dumps({"request": summary}))
+            os.makedirs(CASSETTE_DIR, exist_ok=True)
+        entry["responses"].append(response)
+        with open(_path(key), "a") as f:
+            f.write("".join(line + "\n" for line in lines))
+        _counters["recorded"] += 1
+
+
+def replay(key, summary):
+    """
+    Args:
+        key (str): See request_key
+        summary (dict): See request_key
+    Returns:
+        dict: The next recorded response for the key
+    Raises:
+        CassetteMiss: Nothing was recorded for this request
+    """
+    with _lock:
+        entry = _load(key)
+        if entry is None or not entry["responses"]:
+            _counters["misses"] += 1
+            message = f"No recorded response for {summary['method']} {summary['url']} (cassette key {key[:16]})"
+            # the SDKs turn transport errors into a generic connection error; say what is missing
+            logger.warning(message)
+            raise CassetteMiss(message)
+        index = _cursors.get(key, 0)
+        _cursors[key] = index + 1
+        _counters["replayed"] += 1
+        responses = entry["responses"]
+        return responses[index % len(responses)]
+
+
+class CassetteTransport:
+    """
+    httpx transport, sync and async, that records the responses of an inner transport
+    or replays recorded ones. Install it with transport(); in replay mode it never
+    opens a connection.
+    """
+
+    def __init__(self, httpx, inner=None):
+        # the httpx package of the client using the transport; SDKs may ship their own fork
+        self.httpx = httpx
+        self.inner = inner
+
+    def _replayed_response(self, recorded, request):
+        body = recorded["body"].encode() if recorded["encoding"] == "utf-8" else base64.b64decode(recorded["body"])
+        return self.httpx.Response(recorded["status"], headers=recorded["headers"], content=body, request=request)
+
+    def _recorded_response(self, response, body, request):
+        # body is already decoded, so drop the headers describing the wire encoding
+        headers = [(k, v) for k, v in response.headers.items() if k.lower() not in HOP_HEADERS]
+        return self.httpx.Response(response.status_code, headers=headers, content=body, request=request,
+                                   extensions=response.extensions)
+
+    def handle_request(self, request):
+        request.read()
+        key, summary = request_key(request)
+        if CASSETTE_MODE == "replay":
+            recorded = replay(key, summary)
+            time.sleep(recorded["latency"] * CASSETTE_LATENCY_SCALE)
+            return self._replayed_response(recorded, request)
+        started = time.perf_counter()
+        response = self.inner.handle_request(request)
+        try:
+            body = response.read()
+        finally:
+            response.close()
+        record(key, summary, response.status_code, response.headers, body, time.perf_counter() - started)
+        return self._recorded_response(response, body, request)
+
+    async def handle_async_request(self, request):
+        await request.aread()
+        key, summary = request_key(request)
+        if CASSETTE_MODE == "replay":
+            recorded = replay(key, summary)
+            await asyncio.sleep(recorded["latency"] * CASSETTE_LATENCY_SCALE)
+            return self._replayed_response(recorded, request)
+        started = time.perf_counter()
+        response = await self.inner.handle_async_request(request)
+        try:
+            body = await response.aread()
+        finally:
+            await response.aclose()
+        latency = time.perf_counter() - started
+        await asyncio.to_thread(record, key, summary, response.status_code, response.headers, body, latency)
+        return self._recorded_response(response, body, request)
+
+    def close(self):
+        if self.inner is not None:
+            self.inner.close()
+
+    async def aclose(self):
+        if self.inner is not None:
+            await self.inner.aclose()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+
+def transport(httpx, asynchronous, http2=False):
+    """
+    Args:
+        httpx (module): The httpx package the client is built on
+        asynchronous (bool): For an httpx.AsyncClient instead of an httpx.Client
+        http2 (bool): Whether the recording transport may use HTTP/2
+    Returns:
+        CassetteTransport: The transport for an SDK's httpx client, or None when
+            CASSETTE_MODE is not set
+    """
+    if not CASSETTE_MODE:
+        return None
+    inner = None
+    if CASSETTE_MODE == "record":
+        # the connection limits of the SDKs' own clients
+        limits = httpx.Limits(max_connections=1000, max_keepalive_connections=100)
+        cls = httpx.AsyncHTTPTransport if asynchronous else httpx.HTTPTransport
+        inner = cls(http2=http2, limits=limits)
+    return CassetteTransport(httpx, inner)
+
+
+def stats():
+    """
+    Returns:
+        dict: The mode, and responses recorded, replayed and missing from the cassette
+    """
+    with _lock:
+        stats = dict(_counters)
+    stats["mode"] = CASSETTE_MODE or None
+    return stats
@@ -0,0 +1,225 @@
+# process-wide registry of provider SDK clients
+# SDKs are imported on first use to keep worker start-up cheap
+import os
+import asyncio
+import inspect
+import hashlib
+import logging
+import importlib
+import threading
+from collections import OrderedDict
+
+import runtime
+import cassette
+
+from dotenv import load_dotenv
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# how many clients built from user-supplied keys are kept alive (LRU)
+CLIENT_POOL_SIZE = int(os.getenv("CLIENT_POOL_SIZE", "64"))
+REQUEST_TIMEOUT = float(os.getenv("PROVIDER_TIMEOUT", "600"))
+
+try:
+    import h2  # noqa: F401
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+# provider -> env var with the server key, OpenAI-compatible base url and native SDK base url;
+# the urls can be overridden, e.g. to point the backend at mock_providers.py
+PROVIDERS = {
+    "openai": {
+        "env": "OPENAI_API_KEY",
+        "base_url": os.getenv("OPENAI_BASE_URL"),
+        "native_base_url": None,
+    },
+    "gemini": {
+        "env": "GEMINI_API_KEY",
+        "base_url": os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta/"),
+        "native_base_url": os.getenv("GEMINI_NATIVE_BASE_URL"),
+    },
+    "claude": {
+        "env": "CLAUDE_API_KEY",
+        "base_url": os.getenv("CLAUDE_BASE_URL", "https://api.anthropic.com/v1/"),
+        "native_base_url": os.getenv("ANTHROPIC_BASE_URL"),
+    },
+}
+
+# clients built from server (env) keys live for the whole process
+_pinned = {}
+# clients built from user-supplied keys are bounded and evicted LRU
+_user_clients = OrderedDict()
+_lock = threading.Lock()
+
+
+def hash_key(api_key):
+    """
+    Args:
+        api_key (str): An API key
+    Returns:
+        str: A short, non-reversible fingerprint of the key
+    """
+    return hashlib.sha256((api_key or "").encode()).hexdigest()[:16]
+
+
+def resolve_key(provider, api_key=None):
+    """
+    Args:
+        provider (str): "openai", "gemini" or "claude"
+        api_key (str, optional): User-supplied key. If not provided, uses env var.
+    Returns:
+        str: The key to use for the provider
+    """
+    key = api_key or os.getenv(PROVIDERS[provider]["env"])
+    if not key and cassette.CASSETTE_MODE == "replay":
+        return cassette.REPLAY_KEY
+    return key
+
+
+def _http_client(sdk, asynchronous):
+    # each SDK ships an httpx client subclass with its own pool limits and timeouts;
+    # use it so the client matches the httpx package the SDK was built against
+    cls = sdk.DefaultAsyncHttpxClient if asynchronous else sdk.DefaultHttpxClient
+    if cassette.CASSETTE_MODE:
+        # the transport must come from the same httpx package as the client
+        httpx = importlib.import_module(cls.__mro__[1].__module__.partition(".")[0])
+        return cls(transport=cassette.transport(httpx, asynchronous, HTTP2))
+    return cls(http2=HTTP2)
+
+
+def _get_or_create(registry_key, user_supplied, factory):
+    with _lock:
+        if not user_supplied:
+            client = _pinned.get(registry_key)
+            if client is None:
+                client = _pinned[registry_key] = factory()
+            return client
+
+        client = _user_clients.get(registry_key)
+        if client is not None:
+            _user_clients.move_to_end(registry_key)
+            return client
+        client = _user_clients[registry_key] = factory()
+        evicted = []
+        while len(_user_clients) > CLIENT_POOL_SIZE:
+            evicted.append(_user_clients.popitem(last=False)[1])
+    for old in evicted:
+        runtime.submit(_close_later(old))
+    return client
+
+
+async def _close_later(client):
+    # a call that started before the eviction may still use the client;
+    # none outlives the request timeout
+    await asyncio.sleep(REQUEST_TIMEOUT)
+    try:
+        if hasattr(client, "aio"):
+            # google-genai keeps separate sync and async connection pools
+            client.close()
+            await client.aio.aclose()
+        else:
+            closed = client.close()
+            if inspect.isawaitable(closed):
+                await closed
+    except Exception as e:
+        logger.warning(f"Closing an evicted client failed: {e}")
+
+
+def get_openai_client(provider="openai", api_key=None, asynchronous=True):
+    """
+    OpenAI SDK client for OpenAI itself or a provider's OpenAI-compatible endpoint.
+    Args:
+        provider (str): "openai", "gemini" or "claude"
+        api_key (str, optional): User-supplied key. If not provided, uses env var.
+        asynchronous (bool): Return an AsyncOpenAI client instead of OpenAI
+    Returns:
+        OpenAI | AsyncOpenAI: A shared client with a keep-alive connection pool
+    """
+    key = resolve_key(provider, api_key)
+    base_url = PROVIDERS[provider]["base_url"]
+
+    def factory():
+        import openai
+        cls = openai.AsyncOpenAI if asynchronous else openai.OpenAI
+        # retries are left to ratelimit.call, which also adapts the request rate
+        return cls(
+            api_key=key, base_url=base_url, timeout=REQUEST_TIMEOUT, max_retries=0,
+            http_client=_http_client(openai, asynchronous),
+        )
+
+    return _get_or_create(("openai-sdk", base_url, hash_key(key), asynchronous), bool(api_key), factory)
+
+
+def get_anthropic_client(api_key=None):
+    """
+    Args:
+        api_key (str, optional): User-supplied Anthropic key. If not provided, uses env var.
+    Returns:
+        anthropic.AsyncAnthropic: A shared native Anthropic client
+    """
+    key = resolve_key("claude", api_key)
+
+    def factory():
+        import anthropic
+        return anthropic.AsyncAnthropic(
+            api_key=key, base_url=PROVIDERS["claude"]["native_base_url"], timeout=REQUEST_TIMEOUT, max_retries=0,
+            http_client=_http_client(anthropic, True),
+        )
+
+    return _get_or_create(("anthropic", None, hash_key(key), True), bool(api_key), factory)
+
+
+def get_genai_client(api_key=None):
+    """
+    Args:
+        api_key (str, optional): User-supplied Gemini key. If not provided, uses env var.
+    Returns:
+        google.genai.Client: A shared native Gemini client (use `.aio` for async calls)
+    """
+    key = resolve_key("gemini", api_key)
+
+    def factory():
+        from google import genai
+        from google.genai import types
+        client_args = {"http2": HTTP2}
+        async_client_args = {"http2": HTTP2}
+        if cassette.CASSETTE_MODE:
+            # a custom transport also keeps google-genai on httpx rather than aiohttp
+            import httpx
+            client_args["transport"] = cassette.transport(httpx, False, HTTP2)
+            async_client_args["transport"] = cassette.transport(httpx, True, HTTP2)
+        return genai.Client(
+            api_key=key,
+            http_options=types.HttpOptions(
+                base_url=PROVIDERS["gemini"]["native_base_url"], client_args=client_args, async_client_args=async_client_args
+            ),
+        )
+
+    return _get_or_create(("genai", None, hash_key(key), None), bool(api_key), factory)
+
+
+async def _warm_up_async():
+    async def ping(name, coro):
+        try:
+            await coro
+            logger.info(f"Warmed up {name} connection")
+        except Exception as e:
+            logger.warning(f"Warm-up of {name} failed: {e}")
+
+    pings = []
+    for provider, config in PROVIDERS.items():
+        if os.getenv(config["env"]):
+            pings.append(ping(provider, get_openai_client(provider).models.list()))
+    if os.getenv(PROVIDERS["gemini"]["env"]):
+        pings.append(ping("gemini native", get_genai_client().aio.models.get(model="gemini-2.5-pro")))
+    await asyncio.gather(*pings)
+
+
+def warm_up():
+    """
+    Open connections to every provider with a server key configured, so the
+    first user request does not pay the TCP/TLS handshake. Failures are logged and ignored.
+    """
+    runtime.submit(_warm_up_async())
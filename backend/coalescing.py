@@ -0,0 +1,160 @@
+# single-flight coalescing of identical concurrent /generate requests
+#
+# Requests with the same image, prompt, models, trials, variation type, views, extended run and keys
+# that arrive while an identical one is running subscribe to its pipeline instead
+# of starting their own: the pipeline runs once in a producer thread and every
+# subscriber receives all of its events, including those sent before it joined.
+import os
+import logging
+import threading
+import contextvars
+
+import cache
+import clients
+import imaging
+import tracing
+
+from dotenv import load_dotenv
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+COALESCE_REQUESTS = os.getenv("COALESCE_REQUESTS", "1") == "1"
+
+# request key -> Flight
+_flights = {}
+_lock = threading.Lock()
+_counters = {"executions": 0, "coalesced": 0}
+
+
+class Flight:
+    """
+    One running pipeline and the events it produced so far.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.done = False
+        self.stopped = False
+        self.error = None
+        self.subscribers = 1
+        self.condition = threading.Condition()
+
+
+def request_key(params, preview=False):
+    """
+    Args:
+        params (dict): Parsed request parameters, see main.parse_generate_request
+        preview (bool): Whether the pipeline sends a local summary preview
+    Returns:
+        str: The coalescing key, or None if the request must run on its own
+    """
+    if not COALESCE_REQUESTS or not params["use_cache"]:
+        # bypassCache asks for fresh samples, not someone else's
+        return None
+    api_keys = params["api_keys"] or {}
+    # callers with different keys never share a run, so one's bad key cannot fail another's request
+    fingerprints = {provider: clients.hash_key(clients.resolve_key(provider, api_keys.get(provider)))
+                    for provider in ("openai", "gemini", "claude")}
+    return cache.content_hash(
+        "generate", imaging.image_hash(params["image"]), params["prompt"], params["models"],
+        int(params["num_trials"]), params["variation_type"], params["source"], params["summary_mode"],
+        preview, params.get("views"), params.get("run_id"), fingerprints,
+    )
+
+
+def stream(key, make_events):
+    """
+    Run make_events once per key among concurrent callers and give every caller all its events.
+    Args:
+        key (str): See request_key; None runs make_events for this caller alone
+        make_events (callable): Returns the (event, payload) iterator of the pipeline
+    Yields:
+        tuple: (event, payload), the same objects for every subscriber; do not modify them
+    """
+    if key is None:
+        yield from make_events()
+        return
+
+    with _lock:
+        flight = _flights.get(key)
+        if flight is not None:
+            with flight.condition:
+                if flight.stopped:
+                    flight = None
+                else:
+                    flight.subscribers += 1
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = Flight()
+            _counters["executions"] += 1
+        else:
+            _counters["coalesced"] += 1
+
+    if leader:
+        # the producer inherits this request's context, so its spans land in the leader's trace
+        context = contextvars.copy_context()
+        threading.Thread(
+            target=context.run, args=(_produce, key, flight, make_events), name="coalesced-generation", daemon=True
+        ).start()
+    else:
+        tracing.annotate(coalesced=True)
+    yield from _consume(flight)
+
+
+def _produce(key, flight, make_events):
+    events = None
+    try:
+        events = make_events()
+        for item in events:
+            with flight.condition:
+                flight.events.append(item)
+                flight.condition.notify_all()
+                if not flight.subscribers:
+                    # every client went away; stop paying for the rest
+                    flight.stopped = True
+                    break
+    except Exception as e:
+        logger.exception("Coalesced generation failed")
+        flight.error = e
+    finally:
+        if hasattr(events, "close"):
+            events.close()
+        with _lock:
+            if _flights.get(key) is flight:
+                del _flights[key]
+        with flight.condition:
+            flight.stopped = True
+            flight.done = True
+            flight.condition.notify_all()
+
+
+def _consume(flight):
+    index = 0
+    try:
+        while True:
+            with flight.condition:
+                while index >= len(flight.events) and not flight.done:
+                    flight.condition.wait()
+                batch = flight.events[index:]
+                index += len(batch)
+                if not batch:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+            for item in batch:
+                yield item
+    finally:
+        with flight.condition:
+            flight.subscribers -= 1
+
+
+def stats():
+    """
+    Returns:
+        dict: Pipelines running, pipelines started and requests that joined a running one
+    """
+    with _lock:
+        stats = dict(_counters)
+        stats["in_flight"] = len(_flights)
+        return stats
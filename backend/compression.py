@@ -0,0 +1,105 @@
+# response compression negotiated through Accept-Encoding
+#
+# /generate responses repeat long descriptions and summaries and compress well.
+# Bodies are sent with brotli when the client accepts it and the optional brotli
+# package is installed, otherwise with gzip. Streamed responses (/generate/stream)
+# are left alone: compressing them would hold events back until a block fills up.
+import os
+import gzip
+import logging
+import threading
+
+from flask import request
+
+from dotenv import load_dotenv
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# compress responses; set to 0 when a proxy in front of the app already does
+COMPRESS_RESPONSES = os.getenv("COMPRESS_RESPONSES", "1") == "1"
+# smaller bodies gain too little to pay for compressing them
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+# gzip 1-9 and brotli 0-11; the defaults favour speed, the bodies are built per request
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "5"))
+
+_brotli = None
+_counters = {"compressed": 0, "bytes_in": 0, "bytes_out": 0}
+_lock = threading.Lock()
+
+
+def _get_brotli():
+    # brotli is optional and imported on first use
+    global _brotli
+    if _brotli is None:
+        try:
+            import brotli
+        except ImportError:
+            _brotli = False
+        else:
+            _brotli = brotli
+    return _brotli or None
+
+
+def encodings():
+    """
+    Returns:
+        list: Content codings this server can produce, most preferred first
+    """
+    return ["br", "gzip"] if _get_brotli() is not None else ["gzip"]
+
+
+def compress(body, encoding):
+    """
+    Args:
+        body (bytes): The response body
+        encoding (str): "br" or "gzip"
+    Returns:
+        bytes: The encoded body
+    """
+    if encoding == "br":
+        return _get_brotli().compress(body, quality=COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESS_GZIP_LEVEL)
+
+
+def compress_response(response):
+    """
+    Flask after_request hook compressing the body when the client accepts it.
+    Args:
+        response (flask.Response): The response about to be sent
+    Returns:
+        flask.Response: The same response, possibly with an encoded body
+    """
+    if not COMPRESS_RESPONSES or response.is_streamed or response.direct_passthrough:
+        return response
+    if "Content-Encoding" in response.headers or response.status_code < 200 or response.status_code in (204, 304):
+        return response
+    # the body depends on Accept-Encoding, even when it ends up uncompressed
+    response.vary.add("Accept-Encoding")
+    encoding = request.accept_encodings.best_match(encodings())
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+
+    encoded = compress(body, encoding)
+    response.set_data(encoded)
+    response.headers["Content-Encoding"] = encoding
+    with _lock:
+        _counters["compressed"] += 1
+        _counters["bytes_in"] += len(body)
+        _counters["bytes_out"] += len(encoded)
+    return response
+
+
+def stats():
+    """
+    Returns:
+        dict: Compressed responses and their bytes before and after compression
+    """
+    with _lock:
+        stats = dict(_counters)
+    stats["encodings"] = encodings()
+    return stats
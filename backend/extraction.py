@@ -1,16 +1,39 @@
 # extract all atomic facts from the description.json
-import json
 import os
-from openai import OpenAI
-from google import genai
-from google.genai import types
-import prompts
+import clients
+import runtime
+import ratelimit
+from functools import partial
+from annotations import MODEL_NAMES
 
 from dotenv import load_dotenv
 load_dotenv()
 
+# models for the map-reduce summary: per-model partial summaries, then the final merge
+MAPREDUCE_PARTIAL_MODEL = os.getenv("MAPREDUCE_PARTIAL_MODEL", "gemini-2.5-flash")
+MAPREDUCE_MERGE_MODEL = os.getenv("MAPREDUCE_MERGE_MODEL", "gemini-2.5-pro")
+
+
+# output format and example shared by the single-pass and map-reduce summaries
+OUTPUT_FORMAT = '''# Output Format
+- Indicate model differences clearly with the specified format and example below
+- Never mention the model's name in the sentences in the final paragraph; only show it in the parenthesis.
+- Highlight unique and single claims where applicable.
+- Directly return the revised description; DO NOT say "below is the revised description" or similar first paragraph. DO NOT include "PARAGRAPH:" or similar headings.
+- Please return the response in hierarchical paragraphs, each starting with a short bullet-pointed phrase summarizing the content. Use at least 2 layers of hierarchy.
+- Start from high-level information and then go into details. 
+
+# Example Output:
+## Map Overview\n- The map illustrates the number of US Americans reporting ancestry from various European countries (3 of 3 GPT, 3 of 3 Claude, 3 of 3 Gemini), based on self-reported data from the 2019 American Community Survey (3 of 3 Claude).\n\n## Highest Ancestry Group\n- Germany is most frequently identified as the country with the highest number of US Americans claiming ancestry, reported at 45,000,000 (3 of 3 GPT, 2 of 3 Claude, 3 of 3 Gemini). However, Ireland was also cited as the highest source, with figures of 31,000,000 (1 of 3 GPT) or 54,000,000 (1 of 3 Claude).\n\n## Reported Ancestry Numbers\n- **Germany**: 45,000,000 (3 of 3 GPT, 3 of 3 Claude, 3 of 3 Gemini)\n- **Ireland**: 31,000,000 (2 of 3 GPT), 34,000,000 (1 of 3 GPT, 1 of 3 Claude, 3 of 3 Gemini), 54,000,000 (1 of 3 Claude)\n- **England/UK**: 24,000,000 (1 of 3 GPT), 34,000,000 (2 of 3 Claude), 54,000,000 (3 of 3 Gemini); additionally, the UK is noted as the second highest source at 34,000,000 (1 of 3 Claude)\n- **Italy**: 16,000,000 (3 of 3 Claude, 3 of 3 Gemini), 17,000,000 (2 of 3 GPT), 18,000,000 (1 of 3 GPT)\n- **Poland**: 9,000,000 (3 of 3 GPT, 3 of 3 Claude, 3 of 3 Gemini)\n- **France**: 8,000,000 (2 of 3 GPT, 3 of 3 Claude, 3 of 3 Gemini), 10,000,000 (1 of 3 GPT)\n- **Russia**: 2,000,000 (3 of 3 GPT, 2 of 3 Gemini)\n- **Norway**: 3,400,000 (2 of 3 Claude), 4,500,000 (2 of 3 GPT)\n- **Sweden**: 3,400,000 (1 of 3 Claude), 3,800,000 (2 of 3 GPT, 1 of 3 Claude), 3,900,000 (1 of 3 Claude)\n- **Greece**: 1,200,000 (3 of 3 GPT, 1 of 3 Claude, 3 of 3 Gemini)\n- **Spain**: 1,000,000 (3 of 3 Gemini), 1,300,000 (1 of 3 Claude)\n- **Ukraine**: 1,100,000 (1 of 3 GPT, 2 of 3 Claude)\n- **Iceland**: 54,000 (1 of 3 Claude, 1 of 3 Gemini)\n- **Portugal**: 1,300,000 (2 of 3 Gemini)\n- **Denmark**: 1,200,000 (1 of 3 Claude)\n- **Netherlands**: 3,200,000 (1 of 3 Claude), 5,000,000 (1 of 3 GPT)\n- **Romania**: 1,100,000 (1 of 3 Gemini)
+'''
+
 
 def gemini_thinking(text, num_trials, models, api_keys=None):
+    """Blocking wrapper around gemini_thinking_async."""
+    return runtime.run(gemini_thinking_async(text, num_trials, models, api_keys))
+
+
+async def gemini_thinking_async(text, num_trials, models, api_keys=None):
     """
     Args:
         text (str): The text to process
@@ -20,9 +43,10 @@ def gemini_thinking(text, num_trials, models, api_keys=None):
     Returns:
         str: The description of the image
     """
+    from google.genai import types
+
     gemini_key = api_keys.get("gemini") if api_keys else None
-    key = gemini_key or os.getenv("GEMINI_API_KEY")
-    client = genai.Client(api_key=key)
+    client = clients.get_genai_client(gemini_key)
 
     num_responses = int(num_trials) * len(models)
 
@@ -43,78 +67,91 @@ f'''Reformat and combine the input descriptions into coherent paragraphs that sh
 - The input is a list of descriptions. Each description contains a lot of atomic facts, a response ID, and the model that generated it.
 - There are {num_responses} responses in total: {num_model_specific_responses}. When grouping facts from one response, do not double count. Use a source indicator format like x of {num_trials}, where x = {x_vals}.
 
-# Output Format
-- Indicate model differences clearly with the specified format and example below
-- Never mention the model's name in the sentences in the final paragraph; only show it in the parenthesis.
-- Highlight unique and single claims where applicable.
-- Directly return the revised description; DO NOT say "below is the revised description" or similar first paragraph. DO NOT include "PARAGRAPH:" or similar headings.
-- Please return the response in hierarchical paragraphs, each starting with a short bullet-pointed phrase summarizing the content. Use at least 2 layers of hierarchy.
-- Start from high-level information and then go into details. 
-
-# Example Output:
-## Map Overview\n- The map illustrates the number of US Americans reporting ancestry from various European countries (3 of 3 GPT, 3 of 3 Claude, 3 of 3 Gemini), based on self-reported data from the 2019 American Community Survey (3 of 3 Claude).\n\n## Highest Ancestry Group\n- Germany is most frequently identified as the country with the highest number of US Americans claiming ancestry, reported at 45,000,000 (3 of 3 GPT, 2 of 3 Claude, 3 of 3 Gemini). However, Ireland was also cited as the highest source, with figures of 31,000,000 (1 of 3 GPT) or 54,000,000 (1 of 3 Claude).\n\n## Reported Ancestry Numbers\n- **Germany**: 45,000,000 (3 of 3 GPT, 3 of 3 Claude, 3 of 3 Gemini)\n- **Ireland**: 31,000,000 (2 of 3 GPT), 34,000,000 (1 of 3 GPT, 1 of 3 Claude, 3 of 3 Gemini), 54,000,000 (1 of 3 Claude)\n- **England/UK**: 24,000,000 (1 of 3 GPT), 34,000,000 (2 of 3 Claude), 54,000,000 (3 of 3 Gemini); additionally, the UK is noted as the second highest source at 34,000,000 (1 of 3 Claude)\n- **Italy**: 16,000,000 (3 of 3 Claude, 3 of 3 Gemini), 17,000,000 (2 of 3 GPT), 18,000,000 (1 of 3 GPT)\n- **Poland**: 9,000,000 (3 of 3 GPT, 3 of 3 Claude, 3 of 3 Gemini)\n- **France**: 8,000,000 (2 of 3 GPT, 3 of 3 Claude, 3 of 3 Gemini), 10,000,000 (1 of 3 GPT)\n- **Russia**: 2,000,000 (3 of 3 GPT, 2 of 3 Gemini)\n- **Norway**: 3,400,000 (2 of 3 Claude), 4,500,000 (2 of 3 GPT)\n- **Sweden**: 3,400,000 (1 of 3 Claude), 3,800,000 (2 of 3 GPT, 1 of 3 Claude), 3,900,000 (1 of 3 Claude)\n- **Greece**: 1,200,000 (3 of 3 GPT, 1 of 3 Claude, 3 of 3 Gemini)\n- **Spain**: 1,000,000 (3 of 3 Gemini), 1,300,000 (1 of 3 Claude)\n- **Ukraine**: 1,100,000 (1 of 3 GPT, 2 of 3 Claude)\n- **Iceland**: 54,000 (1 of 3 Claude, 1 of 3 Gemini)\n- **Portugal**: 1,300,000 (2 of 3 Gemini)\n- **Denmark**: 1,200,000 (1 of 3 Claude)\n- **Netherlands**: 3,200,000 (1 of 3 Claude), 5,000,000 (1 of 3 GPT)\n- **Romania**: 1,100,000 (1 of 3 Gemini)
-'''
+{OUTPUT_FORMAT}'''
 
 
-    response = client.models.generate_content(
+    response = await ratelimit.call("gemini", gemini_key, partial(client.aio.models.generate_content,
         model="gemini-2.5-pro",
         config=types.GenerateContentConfig(
         system_instruction= system_instruction,),
         contents=[
             text,
         ],
-    )
+    ))
     return response.text.strip()
+
+
+async def gemini_partial_summary_async(text, num_trials, model, api_keys=None):
     """
-    Generate a summary of the given text using OpenAI's GPT-3 API.
-    
+    Map step of the map-reduce summary: combine one model's descriptions.
     Args:
-        text (str): The input text to summarize
-        api_key (str, optional): OpenAI API key. If not provided, uses env var.
-        
+        text (str): JSON of one model's descriptions
+        num_trials (int): Number of trials
+        model (str): The model that generated the descriptions
+        api_keys (dict, optional): Dictionary with API keys {'openai': str, 'gemini': str, 'claude': str}
     Returns:
-        str: The summary generated by the API
+        str: Combined description annotated with (x of num_trials Model)
     """
-    key = api_key or os.getenv('OPENAI_API_KEY')
-    client = OpenAI(api_key=key)
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        # reasoning_effort="medium",
-        messages=[
-            {
-                "role": "system",
-                "content": prompts.o1_majority_prompt
-            },
-            {
-                "role": "user", 
-                "content": [
-                    {"type": "text", "text": text},
-                ]
-            },
-            
-            ]
-        )
-    return response.choices[0].message.content
+    from google.genai import types
+
+    gemini_key = api_keys.get("gemini") if api_keys else None
+    client = clients.get_genai_client(gemini_key)
+    x_vals = " or ".join(f"{i}" for i in range(num_trials+1))
+
+    system_instruction = \
+f'''Combine the input descriptions, all generated by {model}, into one list of facts that shows how often each fact was stated.
+
+- **Group Facts**: Each description contains multiple atomic facts. Atomic facts are defined as self-contained facts. Combine atomic facts discussing the same subject into a single sentence. If different variations of the same fact exist, list each variation separately.
+- **Annotate Support**: After every fact, add how many of the {num_trials} descriptions state it, using this format: (x of {num_trials} {MODEL_NAMES.get(model, model)}), where x = {x_vals}. When grouping facts from one description, do not double count.
+- Keep every fact, including facts stated by a single description.
+- Directly return the list as Markdown bullet points; DO NOT add an introduction.
+'''
+
+    response = await ratelimit.call("gemini", gemini_key, partial(client.aio.models.generate_content,
+        model=MAPREDUCE_PARTIAL_MODEL,
+        config=types.GenerateContentConfig(
+        system_instruction= system_instruction,),
+        contents=[
+            text,
+        ],
+    ))
+    return response.text.strip()
+
+
+async def gemini_merge_async(partials, num_trials, models, api_keys=None):
     """
-    Remove certain
-        
+    Reduce step of the map-reduce summary: merge per-model summaries into the
+    same annotated format as gemini_thinking.
     Args:
-        data (dict): The parsed JSON data containing descriptions
-        
+        partials (dict): model -> output of gemini_partial_summary_async
+        num_trials (int): Number of trials
+        models (list): List of models
+        api_keys (dict, optional): Dictionary with API keys {'openai': str, 'gemini': str, 'claude': str}
     Returns:
-        dict: A filtered dictionary containing only the atomic facts
+        str: The variation-aware description
     """
-    filtered_data = {}
-    
-    # Iterate through each response in the descriptions
-    for response_id, response_data in data.items():
-        # Skip entries without atomic facts
-        if not response_data.get('atomic_facts'):
-            continue
-            
-        filtered_data[response_id] = {
-            'model': response_data.get('model', 'unknown'),
-            'atomic_facts': response_data['atomic_facts']
-        }
-    
-    return filtered_data
\ No newline at end of file
+    from google.genai import types
+
+    gemini_key = api_keys.get("gemini") if api_keys else None
+    client = clients.get_genai_client(gemini_key)
+
+    system_instruction = \
+f'''Reformat and combine the input fact lists into coherent paragraphs that show detail level differences across models. 
+
+- **Input**: There is one fact list per model ({", ".join(models)}), each built from {num_trials} descriptions by that model. Every fact is already annotated with how many of that model's descriptions state it, e.g. (2 of {num_trials} GPT).
+- **Group Facts**: Combine facts from different models discussing the same subject into a single, coherent sentence. If different variations of the same fact exist, concatenate them using "or".
+- **Paragraph Formation**: Merge the grouped facts into comprehensive paragraphs while ensuring all single and unique claims are included.
+- **Model Differences**: Keep the per-model counts from the input and join them in one parenthesis per fact, e.g. (2 of 3 GPT, 3 of 3 Gemini). Do not change the counts. If a model doesn't support a fact, there is no need to mention it here.
+
+{OUTPUT_FORMAT}'''
+
+    text = "\n\n".join(f"# {model}\n{partial}" for model, partial in partials.items())
+    response = await ratelimit.call("gemini", gemini_key, partial(client.aio.models.generate_content,
+        model=MAPREDUCE_MERGE_MODEL,
+        config=types.GenerateContentConfig(
+        system_instruction= system_instruction,),
+        contents=[
+            text,
+        ],
+    ))
+    return response.text.strip()
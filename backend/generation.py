@@ -1,47 +1,46 @@
 # generative AI
-from openai import OpenAI
-import base64
+import clients
 
 # sys
-import requests
-import os
-import re
-from concurrent.futures import ThreadPoolExecutor
+import asyncio
+from functools import partial
 import json
+import logging
+import cache
+import imaging
+import runtime
+import ratelimit
+import hedging
+import breaker
+import tracing
 # environment
 from dotenv import load_dotenv
 load_dotenv()
 
-def get_gemini_description(image_input, prompt, api_key=None, is_base64=False):
+logger = logging.getLogger(__name__)
+
+async def get_gemini_description_async(image_input, prompt, api_key=None, is_base64=False):
     """
     Args:
-        image_input: The image URL or base64 data URL
+        image_input (imaging.ImageHandle | str): The image, or its URL
         prompt (str): The prompt to generate a description
         api_key (str, optional): Gemini API key. If not provided, uses env var.
-        is_base64 (bool): Whether the image_input is a base64 data URL
+        is_base64 (bool): Whether the image_input is an image rather than a URL
+            (a base64 data URL string is accepted too)
     Returns:
         str: The description of the image
     Note: Uses OpenAI SDK with Google's compatibility layer
     """
-    key = api_key or os.getenv("GEMINI_API_KEY")
-    
     # Use OpenAI SDK with Google's Gemini compatibility endpoint
-    client = OpenAI(
-        api_key=key,
-        base_url="https://generativelanguage.googleapis.com/v1beta/"
-    )
+    client = clients.get_openai_client("gemini", api_key)
     
-    # Prepare image content based on format
-    if is_base64:
-        # Use base64 data URL directly
-        image_url = image_input
-    else:
-        # Use URL format
-        image_url = image_input
+    # the handle builds its data URL once, shared by every trial
+    image = imaging.as_handle(image_input) if is_base64 else None
+    image_url = image.data_url if is_base64 else image_input
     
-    try:
-        # Try using OpenAI SDK format (Gemini compatibility layer)
-        response = client.chat.completions.create(
+    async def compat():
+        # OpenAI SDK format (Gemini compatibility layer)
+        response = await client.chat.completions.create(
             model="gemini-3-flash-preview",
             messages=[
                 {
@@ -59,30 +58,21 @@ def get_gemini_description(image_input, prompt, api_key=None, is_base64=False):
             ],
         )
         return response.choices[0].message.content
-    except Exception as e:
-        # Fallback to native Gemini SDK if OpenAI compatibility doesn't work
-        from google import genai
+
+    async def native():
+        # native Gemini SDK, used when the OpenAI compatibility layer doesn't work
         from google.genai import types
         
-        gemini_client = genai.Client(api_key=key)
+        gemini_client = clients.get_genai_client(api_key)
         
         # Handle image input - convert to bytes if needed
         if is_base64:
-            # Extract base64 string from data URL
-            base64_match = re.search(r'^data:image/(.+);base64,(.+)$', image_input)
-            if base64_match:
-                base64_data = base64_match.group(2)
-                media_type = base64_match.group(1)
-            else:
-                base64_data = image_input
-                media_type = "jpeg"
-            image_bytes = base64.b64decode(base64_data)
+            image_bytes, media_type = image.data, image.media_type
         else:
-            # Download image from URL
-            image_bytes = requests.get(image_input).content
-            media_type = "jpeg"
+            # Download image from URL without blocking the event loop
+            image_bytes, media_type = await asyncio.to_thread(imaging.fetch_image, image_input)
         
-        response = gemini_client.models.generate_content(
+        response = await gemini_client.aio.models.generate_content(
             model="gemini-1.5-pro",
             contents=[
                 prompt,
@@ -91,28 +81,26 @@ def get_gemini_description(image_input, prompt, api_key=None, is_base64=False):
         )
         return response.text.strip()
 
-def get_gpt_description(image_input, prompt, api_key=None, is_base64=False):
+    # the breakers skip whichever path has been failing; retries go through the route again
+    return await ratelimit.call("gemini", api_key, partial(breaker.route, "gemini", [("compat", compat), ("native", native)]))
+
+async def get_gpt_description_async(image_input, prompt, api_key=None, is_base64=False):
     """
     Args:
-        image_input (str): The URL of the image or base64 data URL
+        image_input (imaging.ImageHandle | str): The image, or its URL
         prompt (str): The prompt to generate a description
         api_key (str, optional): OpenAI API key. If not provided, uses env var.
-        is_base64 (bool): Whether the image_input is a base64 data URL
+        is_base64 (bool): Whether the image_input is an image rather than a URL
+            (a base64 data URL string is accepted too)
     Returns:
         str: The description of the image
     """
-    key = api_key or os.getenv("OPENAI_API_KEY")
-    client = OpenAI(api_key=key)
+    client = clients.get_openai_client("openai", api_key)
     
-    # Prepare image content based on format
-    if is_base64:
-        # If it's a base64 data URL, use it directly
-        image_url = image_input
-    else:
-        # If it's a regular URL, use it as is
-        image_url = image_input
+    # the handle builds its data URL once, shared by every trial
+    image_url = imaging.as_handle(image_input).data_url if is_base64 else image_input
     
-    response = client.chat.completions.create(
+    response = await ratelimit.call("openai", api_key, partial(client.chat.completions.create,
         model="gpt-4o",
         messages=[
             {
@@ -132,47 +120,31 @@ def get_gpt_description(image_input, prompt, api_key=None, is_base64=False):
                 ],
             }
         ],
-    )
+    ))
     return response.choices[0].message.content
 
-def get_claude_description(image_input, prompt, api_key=None, is_base64=False):
+async def get_claude_description_async(image_input, prompt, api_key=None, is_base64=False):
     """
     Args:
-        image_input (str): The URL of the image or base64 data URL
+        image_input (imaging.ImageHandle | str): The image, or its URL
         prompt (str): The prompt to generate a description
         api_key (str, optional): Anthropic API key. If not provided, uses env var.
-        is_base64 (bool): Whether the image_input is a base64 data URL
+        is_base64 (bool): Whether the image_input is an image rather than a URL
+            (a base64 data URL string is accepted too)
     Returns:
         str: The description of the image
     Note: Uses OpenAI SDK with Anthropic's compatibility layer
     """
-    key = api_key or os.getenv("CLAUDE_API_KEY")
-    
     # Use OpenAI SDK with Anthropic's compatibility endpoint
-    client = OpenAI(
-        api_key=key,
-        base_url="https://api.anthropic.com/v1/"
-    )
+    client = clients.get_openai_client("claude", api_key)
     
-    # Prepare image content based on format
-    if is_base64:
-        # Extract base64 string and media type from data URL
-        base64_match = re.search(r'^data:image/(.+);base64,(.+)$', image_input)
-        if base64_match:
-            media_type = base64_match.group(1)
-            base64_data = base64_match.group(2)
-            # Use base64 format
-            image_url = f"data:image/{media_type};base64,{base64_data}"
-        else:
-            # Assume it's already a base64 string without data URL prefix
-            image_url = f"data:image/jpeg;base64,{image_input}"
-    else:
-        # Use URL format
-        image_url = image_input
+    # the handle builds its data URL once, shared by every trial
+    image = imaging.as_handle(image_input) if is_base64 else None
+    image_url = image.data_url if is_base64 else image_input
     
-    try:
-        # Try using OpenAI SDK format (Anthropic compatibility layer)
-        response = client.chat.completions.create(
+    async def compat():
+        # OpenAI SDK format (Anthropic compatibility layer)
+        response = await client.chat.completions.create(
             model="claude-3-7-sonnet-20250219",
             max_tokens=1024,
             messages=[
@@ -191,22 +163,13 @@ def get_claude_description(image_input, prompt, api_key=None, is_base64=False):
             ],
         )
         return response.choices[0].message.content
-    except Exception as e:
-        # Fallback to native Anthropic SDK if OpenAI compatibility doesn't work
-        from anthropic import Anthropic
-        anthropic_client = Anthropic(api_key=key)
+
+    async def native():
+        # native Anthropic SDK, used when the OpenAI compatibility layer doesn't work
+        anthropic_client = clients.get_anthropic_client(api_key)
         
         if is_base64:
-            # Extract base64 string from data URL
-            base64_match = re.search(r'^data:image/(.+);base64,(.+)$', image_input)
-            if base64_match:
-                media_type = base64_match.group(1)
-                base64_data = base64_match.group(2)
-            else:
-                base64_data = image_input
-                media_type = "jpeg"
-            
-            response = anthropic_client.messages.create(
+            response = await anthropic_client.messages.create(
                 model="claude-3-7-sonnet-20250219",
                 max_tokens=1024,
                 messages=[
@@ -217,8 +180,8 @@ def get_claude_description(image_input, prompt, api_key=None, is_base64=False):
                                 "type": "image",
                                 "source": {
                                     "type": "base64",
-                                    "media_type": f"image/{media_type}",
-                                    "data": base64_data
+                                    "media_type": f"image/{image.media_type}",
+                                    "data": image.base64
                                 },
                             },
                             {
@@ -230,7 +193,7 @@ def get_claude_description(image_input, prompt, api_key=None, is_base64=False):
                 ],
             )
         else:
-            response = anthropic_client.messages.create(
+            response = await anthropic_client.messages.create(
                 model="claude-3-7-sonnet-20250219",
                 max_tokens=1024,
                 messages=[
@@ -254,7 +217,10 @@ def get_claude_description(image_input, prompt, api_key=None, is_base64=False):
             )
         return response.content[0].text
 
-def prompt_paraphrase(prompt, n=2, api_key=None):
+    # the breakers skip whichever path has been failing; retries go through the route again
+    return await ratelimit.call("claude", api_key, partial(breaker.route, "claude", [("compat", compat), ("native", native)]))
+
+async def prompt_paraphrase_async(prompt, n=2, api_key=None):
     """
     Paraphrase a given prompt to n-1 different prompts
     Args:
@@ -265,8 +231,7 @@ def prompt_paraphrase(prompt, n=2, api_key=None):
         list: A list of n paraphrased
     """
     n = max(1, n)
-    key = api_key or os.getenv("OPENAI_API_KEY")
-    client = OpenAI(api_key=key)
+    client = clients.get_openai_client("openai", api_key)
     prompt = f'''Paraphrase {n} version of the following prompt: {prompt} \n\n
     Please return in following json format: 
     {{
@@ -275,7 +240,7 @@ def prompt_paraphrase(prompt, n=2, api_key=None):
         ...
     }}
     '''
-    response = client.chat.completions.create(
+    response = await ratelimit.call("openai", api_key, partial(client.chat.completions.create,
         model="gpt-4o",
         messages=[
             {
@@ -286,13 +251,13 @@ def prompt_paraphrase(prompt, n=2, api_key=None):
             }
         ],
         response_format={"type": "json_object"}        
-    )
+    ))
     # change the response to json then get the value as a list
     prompts = json.loads(response.choices[0].message.content).values()
     # change to list 
     return list(prompts)
 
-def prompt_persona_variation(prompt, n=2, api_key=None):
+async def prompt_persona_variation_async(prompt, n=2, api_key=None):
     """
     Generate persona-based variations of a given prompt
     Args:
@@ -303,8 +268,7 @@ def prompt_persona_variation(prompt, n=2, api_key=None):
         list: A list of n prompts with different personas applied
     """
     n = max(1, n)
-    key = api_key or os.getenv("OPENAI_API_KEY")
-    client = OpenAI(api_key=key)
+    client = clients.get_openai_client("openai", api_key)
     persona_prompt = f'''Generate {n} different persona-based variations of the following image description prompt. Each variation should maintain the core instruction but adapt it to a different persona or perspective (e.g., casual observer, accessibility advocate, art critic, etc.). Each persona should naturally influence how the description is framed while keeping the essential task the same.
 
 Original prompt: {prompt}
@@ -331,7 +295,7 @@ Example Output:
     "3": "As an art critic, describe this image in detail for someone who cannot see it, highlighting composition, style, and aesthetic qualities."
 }}
 '''
-    response = client.chat.completions.create(
+    response = await ratelimit.call("openai", api_key, partial(client.chat.completions.create,
         model="gpt-4o",
         messages=[
             {
@@ -342,19 +306,212 @@ Example Output:
             }
         ],
         response_format={"type": "json_object"}        
-    )
+    ))
     # change the response to json then get the value as a list
     prompts = json.loads(response.choices[0].message.content).values()
     # change to list 
     return list(prompts)
 
 
-def get_all_descriptions(image, prompt, num_descriptions=3, models=["gemini", "gpt", "claude"], variation_type="original", source="url", api_keys=None):
+# variation type -> prompt variation coroutine
+VARIATION_FUNCTIONS = {
+    "paraphrased": prompt_paraphrase_async,
+    "various": prompt_persona_variation_async, # persona variation
+}
+
+
+async def get_prompt_variations_async(prompt, n, variation_type, api_key=None, use_cache=True):
+    """
+    Args:
+        prompt (str): The input prompt
+        n (int): The number of variations to generate
+        variation_type (str): "paraphrased" or "various" (persona variation)
+        api_key (str, optional): OpenAI API key. If not provided, uses env var.
+        use_cache (bool): Reuse variations generated earlier for the same prompt
+    Returns:
+        list: The generated prompt variations
+    """
+    key = cache.content_hash("variations", prompt, n, variation_type)
+    if use_cache:
+        cached = await cache.variation_cache.aget(key)
+        if cached is not None:
+            return cached
+    with tracing.span("variation", variation_type=variation_type):
+        variations = await VARIATION_FUNCTIONS[variation_type](prompt, n, api_key)
+    await cache.variation_cache.aset(key, variations)
+    return variations
+
+
+# model id -> (api_keys entry, description coroutine)
+MODEL_PROVIDERS = {
+    "gemini": ("gemini", get_gemini_description_async),
+    "gpt": ("openai", get_gpt_description_async),
+    "claude": ("claude", get_claude_description_async),
+}
+
+
+def description_slots(num_descriptions, models):
+    """
+    Args:
+        num_descriptions (int): The number of descriptions for each model
+        models (list): List of models used
+    Returns:
+        list: (trial, model) of every description, in id order (ids start at 1)
+    """
+    return [(t, m) for t in range(1, num_descriptions + 1) for m in models if m in MODEL_PROVIDERS]
+
+
+async def iter_descriptions_async(image, prompt, num_descriptions=3, models=["gemini", "gpt", "claude"], variation_type="original", source="url", api_keys=None, use_cache=True, known=None):
+    """
+    Fan out every (prompt, model) pair as a coroutine on the shared runtime loop and
+    yield each description as soon as its provider call completes.
+    Concurrency across all requests is bounded by runtime.MAX_CONCURRENT_CALLS (see ratelimit.call).
+    Args:
+        image (imaging.ImageHandle | str): The image, its URL or a base64 data URL
+        prompt (str): The prompt to generate a description
+        num_descriptions (int): The number of descriptions to generate for each model
+        variation_type (str): "original", "paraphrased" or "various" (persona variation)
+        source (str): Source type of the image ('url', 'base64' or 'upload')
+        api_keys (dict, optional): Dictionary with API keys {'openai': str, 'gemini': str, 'claude': str}
+        use_cache (bool): Serve descriptions from the description cache when available.
+            Fresh descriptions are written to the cache either way.
+        known (dict, optional): {(trial, model): {"description": str, "prompt": str}} generated
+            earlier (see runs.py); these are reused and later trials keep their prompts
+    Yields:
+        tuple: (id, {"id": id, "model": str, "description": str, "prompt": str}) in completion order
+    """
+    api_keys = api_keys or {}
+    known = known or {}
+    if source == "url" and not isinstance(image, imaging.ImageHandle):
+        # key the cache on the image's content, so a changed image at the same URL is
+        # described afresh; fetch_image revalidates known URLs with a conditional GET
+        with tracing.span("fetch_image"):
+            image = await asyncio.to_thread(imaging.resolve_url, image)
+    image_hash = imaging.image_hash(image)
+
+    # description ids follow (trial, model) order
+    slots = description_slots(num_descriptions, models)
+    # prompts of trials that already ran; new models in those trials get the same prompt
+    known_prompts = {t: entry["prompt"] for (t, m), entry in known.items()}
+
+    def cache_key(t, m):
+        return cache.description_key(image_hash, prompt, m, t, variation_type)
+
+    async def lookup(t, m):
+        hit = known.get((t, m))
+        if hit is None and use_cache:
+            hit = await cache.description_cache.aget(cache_key(t, m))
+        return hit
+
+    hits = await asyncio.gather(*(lookup(t, m) for t, m in slots))
+    missing = []
+    for i, ((t, m), hit) in enumerate(zip(slots, hits), 1):
+        if hit is None:
+            missing.append(i)
+        else:
+            yield i, {"id": i, "model": m, "description": hit["description"], "prompt": hit["prompt"]}
+    if not missing:
+        return
+
+    # download (for URLs), decode and downscale the image once, shared by every model
+    # and trial; runs in a worker thread while the prompt variations are generated
+    missing_models = list(dict.fromkeys(slots[i-1][1] for i in missing))
+
+    async def prepare():
+        if not isinstance(image, imaging.ImageHandle) and source == "url":
+            # the download failed; the providers fetch the URL themselves
+            return {m: image for m in missing_models}, False
+        with tracing.span("prepare_image", source=source):
+            return await asyncio.to_thread(imaging.prepare_image, image, source, missing_models)
+
+    preparing = asyncio.ensure_future(prepare())
+
+    # trial 1 always uses the original prompt, so its calls go out right away;
+    # later trials wait for the prompt variations, which are generated concurrently
+    variations = None
+    if variation_type in VARIATION_FUNCTIONS and any(slots[i-1][0] > 1 and slots[i-1][0] not in known_prompts for i in missing):
+        variations = asyncio.ensure_future(
+            get_prompt_variations_async(prompt, max(1, num_descriptions-1), variation_type, api_keys.get("openai"), use_cache)
+        )
+
+    async def trial_prompt(t):
+        if t in known_prompts:
+            return known_prompts[t]
+        if t == 1 or variations is None:
+            return prompt
+        try:
+            varied = await variations
+        except Exception as e:
+            logger.warning(f"Prompt variation failed, using the original prompt: {e}")
+            return prompt
+        # the variation call may return fewer prompts than asked for
+        return varied[t-2] if t-2 < len(varied) else prompt
+
+    async def fetch_description(i):
+        t, m = slots[i-1]
+        p = await trial_prompt(t)
+        image_inputs, is_base64 = await preparing
+        key_name, func = MODEL_PROVIDERS[m]
+        try:
+            with tracing.span("description", model=m, trial=t):
+                description = await hedging.call(
+                    m, partial(func, image_inputs[m], p, api_keys.get(key_name), is_base64)
+                )
+            await cache.description_cache.aset(cache_key(t, m), {"description": description, "prompt": p})
+        except Exception as e:
+            description = f"Error: {str(e)}"
+        return i, {"id": i, "model": m, "description": description, "prompt": p}
+
+    tasks = [asyncio.ensure_future(fetch_description(i)) for i in missing]
+    try:
+        for future in asyncio.as_completed(tasks):
+            yield await future
+    finally:
+        # the consumer went away (e.g. a closed stream); stop paying for the rest
+        for task in tasks:
+            task.cancel()
+        if variations is not None:
+            variations.cancel()
+
+
+async def get_all_descriptions_async(image, prompt, num_descriptions=3, models=["gemini", "gpt", "claude"], variation_type="original", source="url", api_keys=None, use_cache=True):
+    """
+    Returns:
+        dict: A dictionary containing the descriptions generated by each model, see get_all_descriptions
+    """
+    descriptions = {}
+    async for i, entry in iter_descriptions_async(image, prompt, num_descriptions, models, variation_type, source, api_keys, use_cache):
+        descriptions[i] = entry
+    return dict(sorted(descriptions.items()))
+
+
+def get_gemini_description(image_input, prompt, api_key=None, is_base64=False):
+    """Blocking wrapper around get_gemini_description_async."""
+    return runtime.run(get_gemini_description_async(image_input, prompt, api_key, is_base64))
+
+def get_gpt_description(image_input, prompt, api_key=None, is_base64=False):
+    """Blocking wrapper around get_gpt_description_async."""
+    return runtime.run(get_gpt_description_async(image_input, prompt, api_key, is_base64))
+
+def get_claude_description(image_input, prompt, api_key=None, is_base64=False):
+    """Blocking wrapper around get_claude_description_async."""
+    return runtime.run(get_claude_description_async(image_input, prompt, api_key, is_base64))
+
+def prompt_paraphrase(prompt, n=2, api_key=None):
+    """Blocking wrapper around prompt_paraphrase_async."""
+    return runtime.run(prompt_paraphrase_async(prompt, n, api_key))
+
+def prompt_persona_variation(prompt, n=2, api_key=None):
+    """Blocking wrapper around prompt_persona_variation_async."""
+    return runtime.run(prompt_persona_variation_async(prompt, n, api_key))
+
+def get_all_descriptions(image, prompt, num_descriptions=3, models=["gemini", "gpt", "claude"], variation_type="original", source="url", api_keys=None, use_cache=True):
     """
     Args:
-        image (str): The URL of the image or the base64 encoded image
+        image (imaging.ImageHandle | str): The image, its URL or a base64 data URL
         prompt (str): The prompt to generate a description
         num_descriptions (int): The number of descriptions to generate for each model
+        use_cache (bool): Serve descriptions from the description cache when available
     Returns:
         dict: A dictionary containing the descriptions generated by each model
             {
@@ -367,78 +524,14 @@ def get_all_descriptions(image, prompt, num_descriptions=3, models=["gemini", "g
                 "description": "description of the image"
             },
             ...
+    Note: Blocking wrapper around get_all_descriptions_async; the calling thread only waits.
     """
+    return runtime.run(get_all_descriptions_async(image, prompt, num_descriptions, models, variation_type, source, api_keys, use_cache))
 
-    descriptions = {}
-
-    # decide if need to modify the prompt
-    prompts = [prompt] * num_descriptions
-    print(len(prompts))
-    if variation_type == "paraphrased":
-        openai_key = api_keys.get("openai") if api_keys else None
-        paraphrased = prompt_paraphrase(prompt, max(1, num_descriptions-1), openai_key)
-        prompts = [prompt] + paraphrased
-    elif variation_type == "various": # persona variation
-        openai_key = api_keys.get("openai") if api_keys else None
-        persona_variations = prompt_persona_variation(prompt, max(1, num_descriptions-1), openai_key)
-        prompts = [prompt] + persona_variations
-
-    
-    def fetch_description(p, func, *args):
-        try:
-            return func(*args), p
-        except Exception as e:
-            return f"Error: {str(e)}"
-    
-    tasks = []
-    if source == "url":
-        with ThreadPoolExecutor() as executor:
-            # for all the prompt in the list, generate the description
-            for i, p in enumerate(prompts, 1):
-                # for each model, generate the description
-                for m in models:
-                    if m == "gemini":
-                        gemini_key = api_keys.get("gemini") if api_keys else None
-                        # Gemini can use URL directly with OpenAI SDK compatibility
-                        tasks.append(executor.submit(fetch_description, p, get_gemini_description, image, p, gemini_key, False))
-                    elif m == "gpt":
-                        openai_key = api_keys.get("openai") if api_keys else None
-                        # GPT can use URL directly
-                        tasks.append(executor.submit(fetch_description, p, get_gpt_description, image, p, openai_key, False))
-                    elif m == "claude":
-                        claude_key = api_keys.get("claude") if api_keys else None
-                        # Claude can use URL directly
-                        tasks.append(executor.submit(fetch_description, p, get_claude_description, image, p, claude_key, False))
-            for i, future in enumerate(tasks, 1):
-                m = models[(i-1) % len(models)]
-                
-                descriptions[int(i)] = {"id": i, "model": m, "description": future.result()[0], "prompt": future.result()[1]}
-                # descriptions[int(i)] = {"id": i, "model": m, "description": future.result()[0],}
-
-            return descriptions
-    else:
-        # base64 source - all models can use base64 data URL with OpenAI SDK compatibility
-        with ThreadPoolExecutor() as executor:
-            # for all the prompt in the list, generate the description
-            for i, p in enumerate(prompts, 1):
-                # for each model, generate the description
-                for m in models:
-                    if m == "gemini":
-                        gemini_key = api_keys.get("gemini") if api_keys else None
-                        # Gemini can use base64 data URL directly with OpenAI SDK compatibility
-                        tasks.append(executor.submit(fetch_description, p, get_gemini_description, image, p, gemini_key, True))
-                    elif m == "gpt":
-                        openai_key = api_keys.get("openai") if api_keys else None
-                        # GPT can use base64 data URL directly
-                        tasks.append(executor.submit(fetch_description, p, get_gpt_description, image, p, openai_key, True))
-                    elif m == "claude":
-                        claude_key = api_keys.get("claude") if api_keys else None
-                        # Claude can use base64 data URL directly
-                        tasks.append(executor.submit(fetch_description, p, get_claude_description, image, p, claude_key, True))
-            for i, future in enumerate(tasks, 1):
-                m = models[(i-1) % len(models)]
-                
-                descriptions[int(i)] = {"id": i, "model": m, "description": future.result()[0], "prompt": future.result()[1]}
-            return descriptions
-
-
+def stream_descriptions(image, prompt, num_descriptions=3, models=["gemini", "gpt", "claude"], variation_type="original", source="url", api_keys=None, use_cache=True, known=None):
+    """
+    Blocking iterator over iter_descriptions_async.
+    Yields:
+        tuple: (id, description entry) as soon as each provider call completes
+    """
+    return runtime.iterate(iter_descriptions_async(image, prompt, num_descriptions, models, variation_type, source, api_keys, use_cache, known))
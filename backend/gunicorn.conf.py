@@ -0,0 +1,87 @@
+# production server settings: gunicorn -c gunicorn.conf.py main:app
+#
+# One worker process serving requests on a pool of threads while its provider calls
+# run on the worker's shared asyncio loop; the work is I/O-bound, so threads, not
+# processes, carry the load. Requests over MAX_IN_FLIGHT_REQUESTS get 503 + Retry-After
+# (see admission.py); the extra threads keep health checks, polls and those 503s fast
+# when the worker is full.
+#
+# Jobs (/jobs), runs (runId), in-flight request coalescing and the in-memory caches
+# live in the worker that created them. WEB_CONCURRENCY starts more workers, but then
+# job polls and run extensions that reach another worker return 404.
+import os
+import time
+import signal
+import threading
+
+import admission
+
+# seconds of the grace period kept for exiting after the drain
+DRAIN_MARGIN = 5
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", str(admission.MAX_IN_FLIGHT_REQUESTS + 8)))
+keepalive = 5
+# seconds a stopping worker gets to finish in-flight requests and jobs
+graceful_timeout = int(os.getenv("SHUTDOWN_GRACE_SECONDS", "120"))
+accesslog = "-"
+
+# every worker takes its share of the provider quotas (ratelimit.RATE_LIMIT_RPM)
+os.environ["SERVER_WORKERS"] = str(workers)
+
+
+def when_ready(server):
+    if workers > 1:
+        server.log.warning(
+            f"Running {workers} workers: jobs, runs and request coalescing are not shared between them, "
+            "so /jobs/<id> polls and runId extensions may return 404"
+        )
+
+
+def _drain(timeout):
+    import main
+    main.shutdown(timeout)
+
+
+def post_worker_init(worker):
+    if os.getenv("WARM_UP_LOCAL_SUMMARY", "1") == "1":
+        # local summaries (and the previews of streams and jobs) then take milliseconds from the first request
+        import local_aggregation
+        try:
+            local_aggregation.warm_up()
+        except Exception as e:
+            worker.log.warning(f"Local summary warm-up failed: {e}")
+
+    # start draining jobs as soon as the worker is told to stop, alongside gunicorn's
+    # own wait for in-flight requests, so both fit in the same grace period
+    handle_exit = worker.handle_exit
+
+    def drain_on_exit(sig, frame):
+        handle_exit(sig, frame)
+        if getattr(worker, "drain_thread", None) is None:
+            budget = max(0, graceful_timeout - DRAIN_MARGIN)
+            worker.drain_deadline = time.monotonic() + budget
+            worker.drain_thread = threading.Thread(target=_drain, args=(budget,), name="drain", daemon=True)
+            worker.drain_thread.start()
+
+    worker.handle_exit = drain_on_exit
+    signal.signal(signal.SIGTERM, drain_on_exit)
+    signal.siginterrupt(signal.SIGTERM, False)
+
+
+def worker_exit(server, worker):
+    drain_thread = getattr(worker, "drain_thread", None)
+    if drain_thread is not None:
+        drain_thread.join(max(0, worker.drain_deadline - time.monotonic()))
+    else:
+        # stopped without SIGTERM (e.g. max_requests): the arbiter's timeout applies, not the grace period
+        _drain(max(0, server.cfg.timeout - DRAIN_MARGIN))
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
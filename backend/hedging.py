@@ -0,0 +1,207 @@
+# hedged provider calls: a slow call gets a duplicate, the first answer wins
+#
+# Opt in per model with HEDGE_MODELS. Once a model has enough latency samples,
+# a description call whose provider attempt is still running after the model's
+# latency percentile is duplicated; whichever call answers first is used and the
+# other is cancelled. Duplicates are capped to a share of the model's calls
+# (HEDGE_BUDGET). Latencies are those of provider attempts (see ratelimit.call), not
+# time spent queued at the rate limiter or backing off, and no duplicate is sent
+# while the provider's limiter would queue it.
+import os
+import time
+import asyncio
+import logging
+import contextvars
+from contextlib import contextmanager
+from collections import deque
+
+import tracing
+
+from dotenv import load_dotenv
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# models whose calls may be hedged, e.g. "claude,gemini"
+HEDGE_MODELS = [m.strip() for m in os.getenv("HEDGE_MODELS", "").split(",") if m.strip()]
+# latency percentile after which a duplicate is sent
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+# at most this share of a model's calls may be duplicated; HEDGE_BUDGET_<MODEL> overrides it
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", "0.1"))
+# latencies kept per model, and how many are needed before hedging starts
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "200"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+
+
+class LatencyTracker:
+    """
+    Sliding window of successful call latencies and hedging counters for one model.
+    Only used from the shared runtime loop.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.enabled = model in HEDGE_MODELS
+        self.budget = float(os.getenv(f"HEDGE_BUDGET_{model.upper()}", str(HEDGE_BUDGET)))
+        self.latencies = deque(maxlen=HEDGE_WINDOW)
+        self.counters = {"calls": 0, "hedged": 0, "hedge_wins": 0, "primary_wins": 0, "over_budget": 0, "limiter_busy": 0}
+
+    def record(self, seconds):
+        self.latencies.append(seconds)
+
+    def threshold(self):
+        """
+        Returns:
+            float: The latency percentile in seconds, or None while there are too few samples
+        """
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * HEDGE_PERCENTILE / 100))]
+
+    def can_hedge(self):
+        return self.counters["hedged"] < self.budget * self.counters["calls"]
+
+    def stats(self):
+        """
+        Returns:
+            dict: Counters, the current hedging threshold and the hedge win rate
+        """
+        stats = dict(self.counters)
+        threshold = self.threshold()
+        stats["enabled"] = self.enabled
+        stats["threshold_seconds"] = round(threshold, 3) if threshold is not None else None
+        stats["hedge_win_rate"] = round(stats["hedge_wins"] / stats["hedged"], 4) if stats["hedged"] else 0.0
+        return stats
+
+
+# model -> LatencyTracker
+_trackers = {}
+
+
+def get_tracker(model):
+    tracker = _trackers.get(model)
+    if tracker is None:
+        tracker = _trackers[model] = LatencyTracker(model)
+    return tracker
+
+
+class Attempt:
+    """
+    The provider attempt currently made by one hedged task, as reported by ratelimit.call.
+    """
+
+    def __init__(self):
+        self.started = None
+        self.seconds = None
+        self.limiter = None
+
+    def running_for(self):
+        """
+        Returns:
+            float: Seconds the current attempt has been running, or None between attempts
+        """
+        return time.monotonic() - self.started if self.started is not None else None
+
+
+_attempt = contextvars.ContextVar("hedging_attempt", default=None)
+
+
+@contextmanager
+def attempt(limiter):
+    """
+    Report one provider attempt of the current hedged call, if any.
+    Args:
+        limiter (ratelimit.AdaptiveLimiter): The limiter that admitted the attempt
+    """
+    state = _attempt.get()
+    if state is None:
+        yield
+        return
+    state.limiter = limiter
+    state.started = time.monotonic()
+    try:
+        yield
+        state.seconds = time.monotonic() - state.started
+    finally:
+        state.started = None
+
+
+async def _run(make_call, state):
+    # runs in the task's own copy of the context
+    _attempt.set(state)
+    return await make_call()
+
+
+async def call(model, make_call):
+    """
+    Run a provider call, duplicating it if it runs past the model's latency percentile.
+    Args:
+        model (str): Model id ("gpt", "claude", "gemini")
+        make_call (callable): Returns a new coroutine for each attempt
+    Returns:
+        The result of whichever call answered first
+    """
+    tracker = get_tracker(model)
+    tracker.counters["calls"] += 1
+    threshold = tracker.threshold() if tracker.enabled else None
+
+    states = [Attempt()]
+    primary = asyncio.ensure_future(_run(make_call, states[0]))
+    tasks = [primary]
+    try:
+        while threshold is not None:
+            # wait until the primary's provider attempt, not the call, is past the threshold
+            running = states[0].running_for()
+            done, _ = await asyncio.wait(tasks, timeout=threshold - running if running is not None else threshold)
+            if done:
+                break
+            running = states[0].running_for()
+            if running is None or running < threshold:
+                # still queued at the limiter or backing off; a duplicate would only queue too
+                continue
+            if states[0].limiter is not None and states[0].limiter.saturated():
+                tracker.counters["limiter_busy"] += 1
+            elif tracker.can_hedge():
+                tracker.counters["hedged"] += 1
+                tracing.annotate(hedged=True)
+                states.append(Attempt())
+                tasks.append(asyncio.ensure_future(_run(make_call, states[1])))
+            else:
+                tracker.counters["over_budget"] += 1
+            break
+
+        # take the first successful answer; fail only if every call failed
+        pending = set(tasks)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = error or task.exception()
+                    continue
+                result = task.result()
+                state = states[tasks.index(task)]
+                if state.seconds is not None:
+                    tracker.record(state.seconds)
+                if len(tasks) > 1:
+                    tracker.counters["primary_wins" if task is primary else "hedge_wins"] += 1
+                    # the slow primary is about to be cancelled; keep its time so far, or
+                    # the window would only ever see the faster of the two calls
+                    running = states[0].running_for()
+                    if task is not primary and running is not None:
+                        tracker.record(running)
+                return result
+        raise error
+    finally:
+        # cancel the loser, or everything if the caller went away
+        for task in tasks:
+            task.cancel()
+
+
+def stats():
+    """
+    Returns:
+        dict: Hedging stats per model
+    """
+    return {model: tracker.stats() for model, tracker in list(_trackers.items())}
@@ -1,19 +1,17 @@
-from openai import OpenAI
 import os, sys
 import base64
 import uuid
-import numpy as np
-import torch
 
-from openai import OpenAI
+import clients
+import runtime
+import ratelimit
+from functools import partial
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# avoid segmentation fault
+# avoid segmentation fault in native thread pools (numpy)
 os.environ["OMP_NUM_THREADS"] = "1" 
-torch.set_num_threads(1) 
-np.set_printoptions(threshold=np.inf)
 
 
 def uuid_gen():
@@ -24,6 +22,10 @@ def encode_image(image_path):
     return base64.b64encode(image_file.read()).decode('utf-8')
 
 def gpt4o_wrapper(system_prompt, user_prompt, structure=None, system_role=False, structured=False, json_format=False, api_key=None):
+    """Blocking wrapper around gpt4o_wrapper_async."""
+    return runtime.run(gpt4o_wrapper_async(system_prompt, user_prompt, structure, system_role, structured, json_format, api_key))
+
+async def gpt4o_wrapper_async(system_prompt, user_prompt, structure=None, system_role=False, structured=False, json_format=False, api_key=None):
     """
     Wrapper for GPT-4o API calls
     
@@ -36,8 +38,7 @@ def gpt4o_wrapper(system_prompt, user_prompt, structure=None, system_role=False,
         json_format (bool): Whether to use JSON format
         api_key (str, optional): OpenAI API key. If not provided, uses env var.
     """
-    key = api_key or os.getenv('OPENAI_API_KEY')
-    client = OpenAI(api_key=key)
+    client = clients.get_openai_client("openai", api_key)
     
     if system_role:
         message = [
@@ -50,26 +51,26 @@ def gpt4o_wrapper(system_prompt, user_prompt, structure=None, system_role=False,
         ] 
     if structured:
         try:
-            response = client.beta.chat.completions.parse(
+            response = await ratelimit.call("openai", api_key, partial(client.beta.chat.completions.parse,
                 model="gpt-4o",
                 messages=message,
                 response_format = structure
-            )
+            ))
             return response.choices[0].message.parsed
         except Exception as e:
             print(e)
     elif json_format:
-        response = client.chat.completions.create(
+        response = await ratelimit.call("openai", api_key, partial(client.chat.completions.create,
             model="gpt-4o",
             messages=message,
             response_format = { "type": "json_object" }
-        )
+        ))
         return response.choices[0].message.content
     else:
-        response = client.chat.completions.create(
+        response = await ratelimit.call("openai", api_key, partial(client.chat.completions.create,
             model="gpt-4o",
             messages=message,
-        )
+        ))
         return response.choices[0].message.content
 
 
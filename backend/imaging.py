@@ -0,0 +1,378 @@
+# image preprocessing ahead of the provider fan-out
+import os
+import io
+import re
+import base64
+import socket
+import hashlib
+import logging
+import ipaddress
+import threading
+from urllib.parse import urljoin, urlsplit
+from functools import cached_property
+
+import cache
+
+from dotenv import load_dotenv
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+IMAGE_NORMALIZATION = os.getenv("IMAGE_NORMALIZATION", "1") == "1"
+JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+
+# effective input resolution per model, as (max long edge, max short edge)
+# gpt-4o fits images into 2048x2048 then scales the short side to 768,
+# claude downsizes anything over ~1568px on the long edge,
+# gemini tiles images at 768px and keeps up to 3072px
+MAX_EDGES = {
+    "gpt": (int(os.getenv("IMAGE_MAX_EDGE_GPT", "2048")), int(os.getenv("IMAGE_MAX_SHORT_EDGE_GPT", "768"))),
+    "claude": (int(os.getenv("IMAGE_MAX_EDGE_CLAUDE", "1568")), None),
+    "gemini": (int(os.getenv("IMAGE_MAX_EDGE_GEMINI", "3072")), None),
+}
+
+IMAGE_FETCH_TIMEOUT = float(os.getenv("IMAGE_FETCH_TIMEOUT", "10"))
+IMAGE_FETCH_MAX_BYTES = int(float(os.getenv("IMAGE_FETCH_MAX_MB", "20")) * 1024 * 1024)
+IMAGE_FETCH_CACHE_SIZE = int(os.getenv("IMAGE_FETCH_CACHE_SIZE", "64"))
+# total size of the downloaded images kept for revalidation
+IMAGE_FETCH_CACHE_MAX_BYTES = int(float(os.getenv("IMAGE_FETCH_CACHE_MB", "128")) * 1024 * 1024)
+IMAGE_FETCH_MAX_REDIRECTS = 5
+# image URLs are user input: only public addresses are fetched unless this is set (local development)
+IMAGE_FETCH_ALLOW_PRIVATE = os.getenv("IMAGE_FETCH_ALLOW_PRIVATE", "0") == "1"
+
+DATA_URL_PATTERN = re.compile(r'^data:image/([\w.+-]+);base64,')
+
+
+# leading bytes of the formats providers accept -> media type
+MAGIC_NUMBERS = [
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+]
+
+
+class ImageHandle:
+    """
+    An image parsed once per request: its bytes, media type and content hash.
+    The base64 form and data URL are built on first use and shared by every
+    provider call and trial that receives the handle. Treat it as read-only.
+    """
+
+    def __init__(self, data, media_type="jpeg"):
+        self._data = bytes(data)
+        self._media_type = media_type
+
+    @classmethod
+    def from_data_url(cls, image_input):
+        """
+        Args:
+            image_input (str): A base64 data URL, or a bare base64 string
+        Returns:
+            ImageHandle: The decoded image
+        Raises:
+            ValueError: If the base64 data is invalid
+        """
+        media_type, base64_data = split_data_url(image_input)
+        handle = cls(base64.b64decode(base64_data, validate=False), media_type)
+        # the caller already paid for the encoded form; keep it instead of re-encoding
+        handle.__dict__["base64"] = base64_data
+        return handle
+
+    @property
+    def data(self):
+        return self._data
+
+    @property
+    def media_type(self):
+        return self._media_type
+
+    @cached_property
+    def hash(self):
+        return hashlib.sha256(self._data).hexdigest()
+
+    @cached_property
+    def base64(self):
+        return base64.b64encode(self._data).decode("ascii")
+
+    @cached_property
+    def data_url(self):
+        return f"data:image/{self._media_type};base64,{self.base64}"
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f"ImageHandle({self._media_type}, {len(self._data)} bytes, {self.hash[:12]})"
+
+
+def as_handle(image_input):
+    """
+    Args:
+        image_input (ImageHandle | str): A handle, or a base64 data URL / bare base64 string
+    Returns:
+        ImageHandle: The image as a handle, parsing strings once
+    """
+    if isinstance(image_input, ImageHandle):
+        return image_input
+    return ImageHandle.from_data_url(image_input)
+
+
+def image_hash(image):
+    """
+    Args:
+        image (ImageHandle | str): An image handle or an image URL
+    Returns:
+        str: Content hash of the image, used in cache and coalescing keys; for a URL,
+            a hash of the URL itself (see resolve_url to hash what it points to)
+    """
+    if isinstance(image, ImageHandle):
+        return image.hash
+    return cache.content_hash(image)
+
+
+def sniff_media_type(data, default="jpeg"):
+    """
+    Args:
+        data (bytes): Encoded image bytes
+        default (str): Media type to assume for unknown formats
+    Returns:
+        str: Image subtype guessed from the leading bytes, e.g. "png"
+    """
+    for magic, media_type in MAGIC_NUMBERS:
+        if data.startswith(magic):
+            return media_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return default
+
+
+# keep-alive connections to image hosts, shared across requests
+_session = None
+_session_lock = threading.Lock()
+# url -> downloaded image with its ETag / Last-Modified validators
+_fetched = cache.LRUCache(IMAGE_FETCH_CACHE_SIZE, max_bytes=IMAGE_FETCH_CACHE_MAX_BYTES,
+                          sizeof=lambda entry: len(entry["data"]))
+
+
+def split_data_url(image_input):
+    """
+    Args:
+        image_input (str): A base64 data URL, or a bare base64 string
+    Returns:
+        tuple: (media_type, base64_data), media_type defaults to "jpeg"
+    """
+    match = DATA_URL_PATTERN.match(image_input)
+    if match:
+        return match.group(1), image_input[match.end():]
+    return "jpeg", image_input
+
+
+def target_size(width, height, max_edge, max_short_edge=None):
+    """
+    Args:
+        width (int), height (int): Original size
+        max_edge (int): Max length of the long edge
+        max_short_edge (int, optional): Max length of the short edge
+    Returns:
+        tuple: (width, height) scaled down to fit, never up
+    """
+    scale = min(1.0, max_edge / max(width, height))
+    if max_short_edge:
+        scale = min(scale, max_short_edge / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _encode(image, size):
+    from PIL import Image
+
+    if image.size != size:
+        image = image.resize(size, Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def _get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            session.mount("http://", HTTPAdapter(pool_connections=16, pool_maxsize=32))
+            session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=32))
+            _session = session
+    return _session
+
+
+def check_url(url):
+    """
+    Args:
+        url (str): An image URL from a request
+    Raises:
+        ValueError: If the URL is not http(s), or its host resolves to a loopback,
+            private, link-local or otherwise non-public address
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError(f"Only http(s) image URLs can be fetched: {url}")
+    if IMAGE_FETCH_ALLOW_PRIVATE:
+        return
+    try:
+        addresses = socket.getaddrinfo(parts.hostname, parts.port or (443 if parts.scheme == "https" else 80),
+                                       type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError) as e:
+        raise ValueError(f"Cannot resolve image host {parts.hostname}: {e}")
+    for *_, sockaddr in addresses:
+        address = ipaddress.ip_address(sockaddr[0].split("%")[0])
+        if not address.is_global or address.is_multicast:
+            raise ValueError(f"Image host {parts.hostname} resolves to a non-public address")
+
+
+def _get(url, headers):
+    # redirects are followed by hand so that every hop's host is checked
+    session = _get_session()
+    for _ in range(IMAGE_FETCH_MAX_REDIRECTS + 1):
+        check_url(url)
+        response = session.get(url, headers=headers, timeout=IMAGE_FETCH_TIMEOUT, stream=True, allow_redirects=False)
+        if not response.is_redirect:
+            return response
+        location = response.headers["Location"]
+        response.close()
+        url = urljoin(url, location)
+    raise ValueError(f"Too many redirects fetching image {url}")
+
+
+def fetch_image(url):
+    """
+    Download an image through the shared session. Responses carrying an ETag or
+    Last-Modified header are cached and revalidated with a conditional GET.
+    Args:
+        url (str): The image URL
+    Returns:
+        tuple: (bytes, media_type)
+    Raises:
+        ValueError: If the URL is not a public http(s) URL (see check_url), or the
+            image is larger than IMAGE_FETCH_MAX_MB
+        requests.RequestException: If the download fails or times out
+    """
+    cached = _fetched.get(url)
+    headers = {}
+    if cached is not None:
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    with _get(url, headers) as response:
+        if response.status_code == 304 and cached is not None:
+            return cached["data"], cached["media_type"]
+        response.raise_for_status()
+        if int(response.headers.get("Content-Length") or 0) > IMAGE_FETCH_MAX_BYTES:
+            raise ValueError(f"Image at {url} is larger than {IMAGE_FETCH_MAX_BYTES} bytes")
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            size += len(chunk)
+            if size > IMAGE_FETCH_MAX_BYTES:
+                raise ValueError(f"Image at {url} is larger than {IMAGE_FETCH_MAX_BYTES} bytes")
+            chunks.append(chunk)
+        data = b"".join(chunks)
+        content_type = response.headers.get("Content-Type", "")
+        media_type = content_type.split(";")[0].split("/")[-1].strip() if content_type.startswith("image/") else "jpeg"
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+
+    # without a validator we could not tell if the image changed, so do not cache it
+    if etag or last_modified:
+        _fetched.set(url, {"data": data, "media_type": media_type, "etag": etag, "last_modified": last_modified})
+    return data, media_type
+
+
+def resolve_url(url):
+    """
+    Args:
+        url (str): The image URL
+    Returns:
+        ImageHandle | str: The downloaded image, or the URL itself if it cannot be
+            downloaded, for the providers to fetch
+    """
+    try:
+        return ImageHandle(*fetch_image(url))
+    except Exception as e:
+        logger.warning(f"Could not fetch image, passing the URL to providers: {e}")
+        return url
+
+
+def prepare_image(image, source, models):
+    """
+    Resolve the request image once for every model and trial: URL images are
+    downloaded once, then everything is decoded and normalized once.
+    Args:
+        image (ImageHandle | str): An image handle, the URL of the image or a base64 data URL
+        source (str): Source type of the image ('url', 'base64' or 'upload')
+        models (list): Models the image will be sent to
+    Returns:
+        tuple: (dict of model -> image input, is_base64). Inputs are ImageHandles, or
+            the URL itself if a URL image cannot be downloaded, for the providers to fetch.
+    """
+    if isinstance(image, ImageHandle):
+        original = image
+    elif source == "url":
+        original = resolve_url(image)
+        if not isinstance(original, ImageHandle):
+            return {m: image for m in models}, False
+    else:
+        try:
+            original = ImageHandle.from_data_url(image)
+        except ValueError as e:
+            logger.warning(f"Could not decode image, passing it through unchanged: {e}")
+            return {m: image for m in models}, True
+    return normalize_image(original, models), True
+
+
+def normalize_image(original, models):
+    """
+    Decode an image once and re-encode a downscaled JPEG per distinct
+    model resolution, so every trial shares the same compact payload.
+    Args:
+        original (ImageHandle): The image as received
+        models (list): Models the image will be sent to
+    Returns:
+        dict: model -> ImageHandle to send. Falls back to the original image
+            for every model when the image cannot be decoded.
+    """
+    if not IMAGE_NORMALIZATION:
+        return {m: original for m in models}
+    try:
+        from PIL import Image, ImageOps
+
+        image = Image.open(io.BytesIO(original.data))
+        # phone photos carry their rotation in EXIF, which is lost on re-encoding
+        image = ImageOps.exif_transpose(image)
+        if image.mode != "RGB":
+            # flatten transparency onto white rather than black
+            rgba = image.convert("RGBA")
+            image = Image.new("RGB", rgba.size, (255, 255, 255))
+            image.paste(rgba, mask=rgba.getchannel("A"))
+    except Exception as e:
+        logger.warning(f"Image normalization skipped: {e}")
+        return {m: original for m in models}
+
+    encoded = {}
+    result = {}
+    for m in models:
+        max_edge, max_short_edge = MAX_EDGES.get(m, (max(image.size), None))
+        size = target_size(image.width, image.height, max_edge, max_short_edge)
+        if size not in encoded:
+            jpeg = _encode(image, size)
+            # keep the image as-is when re-encoding would not make it smaller
+            encoded[size] = ImageHandle(jpeg, "jpeg") if len(jpeg) < len(original) else original
+        result[m] = encoded[size]
+    logger.info(
+        f"Normalized image from {len(original)} bytes {image.size} to "
+        + ", ".join(f"{size}: {len(handle)} bytes" for size, handle in encoded.items())
+    )
+    return result
@@ -0,0 +1,157 @@
+# background jobs for long-running /generate requests
+import os
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pipeline
+import tracing
+
+from dotenv import load_dotenv
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# pipelines running at once, and jobs allowed to wait for a worker
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "32"))
+# finished jobs are kept this many seconds for polling
+JOB_TTL = float(os.getenv("JOB_TTL", "3600"))
+
+_jobs = {}
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+# admission control: one slot per running or queued job
+_slots = threading.BoundedSemaphore(JOB_WORKERS + JOB_QUEUE_SIZE)
+
+
+def submit_job(params):
+    """
+    Queue a /generate request for background execution.
+    Args:
+        params (dict): Parsed request parameters, see main.parse_generate_request
+    Returns:
+        str: The job id, or None if the queue is full
+    """
+    _expire_jobs()
+    if not _slots.acquire(blocking=False):
+        return None
+    job_id = str(uuid.uuid4())
+    now = time.time()
+    job = {
+        "id": job_id,
+        "status": "queued",
+        "created": now,
+        "updated": now,
+        "descriptions": {},
+        "variationSummary": None,
+        "runId": None,
+        "error": None,
+    }
+    with _lock:
+        _jobs[job_id] = job
+    _executor.submit(_run_job, job, params)
+    return job_id
+
+
+def get_job(job_id):
+    """
+    Args:
+        job_id (str): The job id returned by submit_job
+    Returns:
+        dict: A snapshot of the job's status, descriptions so far and summary, or None if unknown
+    """
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        snapshot = {
+            "jobId": job["id"],
+            "status": job["status"],
+            "descriptions": dict(sorted(job["descriptions"].items())),
+            "imageId": None,
+            "runId": job["runId"],
+            "variationSummary": dict(job["variationSummary"]) if job["variationSummary"] else None,
+            "error": job["error"],
+        }
+        if "timings" in job:
+            snapshot["timings"] = job["timings"]
+        return snapshot
+
+
+def stats():
+    """
+    Returns:
+        dict: Number of jobs per status
+    """
+    counts = {}
+    with _lock:
+        for job in _jobs.values():
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+    return counts
+
+
+def drain(timeout):
+    """
+    Wait for queued and running jobs to finish, e.g. before the worker exits.
+    Args:
+        timeout (float): Seconds to wait at most
+    Returns:
+        bool: Whether every job finished in time
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        active = sum(stats().get(status, 0) for status in ("queued", "running"))
+        if not active:
+            return True
+        if time.monotonic() >= deadline:
+            logger.warning(f"{active} jobs still unfinished after {timeout}s")
+            return False
+        time.sleep(0.5)
+
+
+def _update(job, **fields):
+    with _lock:
+        job.update(fields)
+        job["updated"] = time.time()
+
+
+def _run_job(job, params):
+    try:
+        _update(job, status="running")
+        with tracing.request("/jobs") as trace:
+            for event, payload in pipeline.streamed_generation(
+                params["image"], params["num_trials"], params["models"], params["variation_type"], params["prompt"],
+                source=params["source"], api_keys=params["api_keys"], use_cache=params["use_cache"],
+                summary_mode=params["summary_mode"], preview=True, views=params.get("views"),
+                known=params.get("known")
+            ):
+                with _lock:
+                    if event == "description":
+                        job["descriptions"][payload["id"]] = payload
+                    elif event in ("preview", "model_diff"):
+                        # the local preview is shown until the LLM summary replaces it
+                        job["variationSummary"] = dict(payload)
+                    elif event == "analysis":
+                        job["variationSummary"].update(payload)
+                    elif event == "done":
+                        job["runId"] = payload["runId"]
+                    job["updated"] = time.time()
+        if params.get("timings"):
+            _update(job, status="done", timings=trace.breakdown())
+        else:
+            _update(job, status="done")
+    except Exception as e:
+        logger.exception(f"Job {job['id']} failed")
+        _update(job, status="failed", error=str(e))
+    finally:
+        _slots.release()
+
+
+def _expire_jobs():
+    cutoff = time.time() - JOB_TTL
+    with _lock:
+        for job_id in [k for k, job in _jobs.items() if job["status"] in ("done", "failed") and job["updated"] < cutoff]:
+            del _jobs[job_id]
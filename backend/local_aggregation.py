@@ -0,0 +1,229 @@
+# LLM-free variation-aware summary built from sentence clustering
+import os
+import re
+import logging
+import functools
+
+import annotations
+
+from dotenv import load_dotenv
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# cosine similarity above which two sentences count as the same claim
+SIMILARITY_THRESHOLD = float(os.getenv("LOCAL_SIMILARITY_THRESHOLD", "0.35"))
+# claims this similar but with different numbers are reported as disagreements
+DISAGREEMENT_THRESHOLD = float(os.getenv("LOCAL_DISAGREEMENT_THRESHOLD", "0.3"))
+
+MODEL_NAMES = annotations.MODEL_NAMES
+
+STOPWORDS = set('''
+a an the and or but if of to in on at by for with from as into onto over under about above below
+is are was were be been being has have had do does did it its it's this that these those there here
+which who whom whose what where when while also very can could may might appears appear seems seem
+image picture photo shows showing shown depicts depicting features featuring visible see seen
+'''.split())
+
+TOKEN_PATTERN = re.compile(r"[a-z]+|\d+(?:[.,]\d+)*")
+NUMBER_PATTERN = re.compile(r"\d+(?:[.,]\d+)*")
+# markdown list markers, headings and emphasis stripped before splitting into sentences
+MARKUP_PATTERN = re.compile(r"^\s*(?:#+|[-*•]|\d+[.)])\s*|\*\*|__")
+
+
+def split_sentences(text):
+    """
+    Args:
+        text (str): A description, possibly in Markdown
+    Returns:
+        list: Its sentences, one per list item / line / sentence
+    """
+    sent_tokenize = _sentence_tokenizer()
+    sentences = []
+    for line in text.splitlines():
+        line = MARKUP_PATTERN.sub("", line).strip()
+        if not line:
+            continue
+        parts = sent_tokenize(line) if sent_tokenize else re.split(r"(?<=[.!?])\s+(?=[A-Z\"'(])", line)
+        # keep short list items such as "Germany: 45,000,000", drop stray fragments
+        sentences.extend(p.strip() for p in parts if len(TOKEN_PATTERN.findall(p.lower())) >= 2)
+    return sentences
+
+
+@functools.lru_cache(maxsize=None)
+def _sentence_tokenizer():
+    # nltk's sent_tokenize, or None when its punkt data is not downloaded;
+    # a punctuation split is close enough then
+    try:
+        from nltk.tokenize import sent_tokenize
+        sent_tokenize("Probe.")
+    except LookupError:
+        return None
+    return sent_tokenize
+
+
+def warm_up():
+    """
+    Import numpy and nltk and load the sentence tokenizer, which takes a few hundred
+    milliseconds, so that the first local summary does not pay for it.
+    """
+    cluster_claims({1: {"model": "gpt", "description": "Warm up the local summary. It clusters these sentences."}})
+
+
+def _tokenize(sentence, stem):
+    return [stem(t) for t in TOKEN_PATTERN.findall(sentence.lower()) if t not in STOPWORDS]
+
+
+def _tfidf(sentences):
+    import numpy as np
+    # the Porter stemmer is pure Python and needs no downloaded nltk data
+    from nltk.stem import PorterStemmer
+
+    stem = PorterStemmer().stem
+    tokenized = [_tokenize(s, stem) for s in sentences]
+    vocabulary = {t: i for i, t in enumerate(sorted({t for tokens in tokenized for t in tokens}))}
+    counts = np.zeros((len(sentences), max(1, len(vocabulary))))
+    for row, tokens in enumerate(tokenized):
+        for t in tokens:
+            counts[row, vocabulary[t]] += 1
+    document_frequency = (counts > 0).sum(axis=0)
+    idf = np.log((1 + len(sentences)) / (1 + document_frequency)) + 1
+    vectors = counts * idf
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def cluster_claims(descs):
+    """
+    Group equivalent sentences across descriptions, once for both the summary
+    and the analysis.
+    Args:
+        descs (dict): Descriptions generated by get_all_descriptions
+    Returns:
+        dict: "clusters", as dicts with "text" (representative sentence), "support"
+            ({model: number of descriptions stating it}), "members" (member sentence
+            indices) and "first" (position of the earliest member), plus the
+            "sentences", their "owners" ((desc_id, model)) and their "similarity"
+            matrix the clusters index into
+    """
+    import numpy as np
+
+    sentences, owners = [], []
+    for desc_id, entry in descs.items():
+        if desc_id == "prompt" or entry["description"].startswith("Error:"):
+            continue
+        for sentence in split_sentences(entry["description"]):
+            sentences.append(sentence)
+            owners.append((desc_id, entry["model"]))
+    if not sentences:
+        return {"clusters": [], "sentences": [], "owners": [], "similarity": None}
+
+    vectors = _tfidf(sentences)
+    similarity = vectors @ vectors.T
+    numbers = [frozenset(NUMBER_PATTERN.findall(s)) for s in sentences]
+    unassigned = np.ones(len(sentences), dtype=bool)
+    clusters = []
+    # leader clustering: each unassigned sentence claims every unassigned sentence close to it
+    for leader in range(len(sentences)):
+        if not unassigned[leader]:
+            continue
+        # sentences stating different numbers are conflicting claims, not the same one
+        compatible = np.array([not numbers[leader] or not n or n == numbers[leader] for n in numbers])
+        members = np.flatnonzero(unassigned & compatible & (similarity[leader] >= SIMILARITY_THRESHOLD))
+        unassigned[members] = False
+        # representative: the member most similar to the rest of its cluster
+        centrality = similarity[np.ix_(members, members)].sum(axis=1)
+        representative = members[int(np.argmax(centrality))]
+        support = {}
+        for desc_id, model in {owners[m] for m in members}:
+            support[model] = support.get(model, 0) + 1
+        clusters.append({
+            "text": sentences[representative],
+            "support": support,
+            "members": members,
+            "first": int(members.min()),
+        })
+    return {"clusters": clusters, "sentences": sentences, "owners": owners, "similarity": similarity}
+
+
+def _sentence(text):
+    text = text.rstrip()
+    return text[:-1] if text.endswith((".", "!", "?")) else text
+
+
+def local_aggregation(claims, num_trials, models):
+    """
+    Build a variation-aware summary in the same "(x of N Model)" annotated
+    Markdown format as extraction.gemini_thinking, without any LLM call.
+    Args:
+        claims (dict): The descriptions' claims, see cluster_claims
+        num_trials (int): Number of trials
+        models (list): List of models
+    Returns:
+        str: The annotated summary
+    """
+    clusters = claims["clusters"]
+    total = int(num_trials) * len(models)
+    sections = {"Widely Shared Details": [], "Details From Some Descriptions": [], "Unique Details": []}
+    for cluster in sorted(clusters, key=lambda c: (-sum(c["support"].values()), c["first"])):
+        count = sum(cluster["support"].values())
+        if count * 2 >= total:
+            section = "Widely Shared Details"
+        elif count > 1:
+            section = "Details From Some Descriptions"
+        else:
+            section = "Unique Details"
+        sections[section].append(f"- {_sentence(cluster['text'])} {annotations.format_annotation(cluster['support'], num_trials, models)}.")
+
+    blocks = [f"## {title}\n" + "\n".join(lines) for title, lines in sections.items() if lines]
+    return "\n\n".join(blocks)
+
+
+def local_analysis(claims, num_trials, models):
+    """
+    LLM-free counterpart of the similarity/uniqueness/disagreement analysis.
+    Args:
+        claims (dict): The descriptions' claims, see cluster_claims
+        num_trials (int): Number of trials
+        models (list): List of models
+    Returns:
+        dict: {"similarity", "uniqueness", "disagreement"} as Markdown bullet lists
+    """
+    import numpy as np
+
+    clusters = claims["clusters"]
+    active = [m for m in models if any(c["support"].get(m) for c in clusters)]
+    similarity, uniqueness, disagreement = [], [], []
+    for cluster in clusters:
+        supporters = [m for m in active if cluster["support"].get(m)]
+        if len(active) > 1 and len(supporters) == len(active):
+            similarity.append(f"- {_sentence(cluster['text'])}.")
+        elif len(active) > 1 and len(supporters) == 1:
+            uniqueness.append(f"- Only {MODEL_NAMES.get(supporters[0], supporters[0])} mentions: {_sentence(cluster['text'])}.")
+
+    if clusters:
+        sentences, owners, sim = claims["sentences"], claims["owners"], claims["similarity"]
+        label = np.empty(len(sentences), dtype=int)
+        for index, cluster in enumerate(clusters):
+            label[cluster["members"]] = index
+        reported = set()
+        # similar claims from different models that state different numbers
+        for i, j in zip(*np.nonzero(np.triu(sim, 1) >= DISAGREEMENT_THRESHOLD)):
+            a, b = label[i], label[j]
+            if a == b or owners[i][1] == owners[j][1] or (min(a, b), max(a, b)) in reported:
+                continue
+            numbers_i = set(NUMBER_PATTERN.findall(sentences[i]))
+            numbers_j = set(NUMBER_PATTERN.findall(sentences[j]))
+            # a sentence repeating one of the other's numbers is elaborating, not disagreeing
+            if numbers_i and numbers_j and not numbers_i <= numbers_j and not numbers_j <= numbers_i:
+                reported.add((min(a, b), max(a, b)))
+                disagreement.append(
+                    f"- {MODEL_NAMES.get(owners[i][1], owners[i][1])}: {_sentence(sentences[i])}; "
+                    f"{MODEL_NAMES.get(owners[j][1], owners[j][1])}: {_sentence(sentences[j])}."
+                )
+
+    return {
+        "similarity": "\n".join(similarity),
+        "uniqueness": "\n".join(uniqueness),
+        "disagreement": "\n".join(disagreement),
+    }
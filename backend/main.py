@@ -1,10 +1,26 @@
-from flask import Flask, request, jsonify
+import json
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS, cross_origin
 
+import os
+import time
 from dotenv import load_dotenv
 load_dotenv()
 
 import pipeline
+import clients
+import cache
+import jobs
+import ratelimit
+import hedging
+import breaker
+import tracing
+import admission
+import coalescing
+import imaging
+import compression
+import runs
+import cassette
 
 
 app = Flask(__name__)
@@ -18,6 +34,16 @@ app = Flask(__name__)
 
 CORS(app)
 app.config["CORS_HEADERS"] = "Content-Type"
+# largest request body: an uploaded image, or a base64 image inside JSON
+app.config["MAX_CONTENT_LENGTH"] = int(float(os.getenv("MAX_UPLOAD_MB", "32")) * 1024 * 1024)
+# turn requests away with 503 once MAX_IN_FLIGHT_REQUESTS are being served
+app.wsgi_app = admission.AdmissionMiddleware(app.wsgi_app)
+# gzip / brotli response bodies for clients that accept them
+app.after_request(compression.compress_response)
+
+# open provider connections before the first request arrives
+if os.getenv("WARM_UP_CLIENTS", "0") == "1":
+    clients.warm_up()
 
 # File paths macro
 # DATA_DIR = "data/"
@@ -44,30 +70,121 @@ curr_data_name =[]
 
     # return jsonify({"message": "Directory created"}), 200
 
-@app.route('/generate', methods=['POST',])
-def generate_descriptions():
+def read_generate_request():
     """
-    API endpoint to generate descriptions from different models
+    Read the /generate fields from a JSON body, a multipart/form-data upload (the
+    image in an "image" file field, the other fields as form fields) or a raw
+    image body (the other fields in the query string).
+    Returns:
+        dict: The request fields; uploaded images are already ImageHandles
+    """
+    if request.mimetype == "multipart/form-data":
+        data = request.form.to_dict()
+        data["selectedModels"] = _list_field(request.form.getlist("selectedModels"))
+        if "views" in request.form:
+            data["views"] = _list_field(request.form.getlist("views"))
+        upload = request.files.get("image")
+        if upload is not None:
+            image = upload.read()
+            data["image"] = imaging.ImageHandle(image, imaging.sniff_media_type(image, _media_type(upload.mimetype)))
+            data["source"] = "upload"
+        return data
+    if request.mimetype.startswith("image/") or request.mimetype == "application/octet-stream":
+        data = request.args.to_dict()
+        data["selectedModels"] = _list_field(request.args.getlist("selectedModels"))
+        if "views" in request.args:
+            data["views"] = _list_field(request.args.getlist("views"))
+        image = request.get_data(cache=False)
+        data["image"] = imaging.ImageHandle(image, imaging.sniff_media_type(image, _media_type(request.mimetype)))
+        data["source"] = "upload"
+        return data
+    return request.get_json()
+
+def _media_type(mimetype):
+    # image subtype declared by the client; other types (browsers send
+    # application/octet-stream for untyped blobs) are assumed to be JPEG
+    return mimetype.split("/")[-1] if mimetype and mimetype.startswith("image/") else "jpeg"
+
+def _list_field(values):
+    # repeated fields, a comma separated value or a JSON list
+    if len(values) == 1:
+        value = values[0].strip()
+        if value.startswith("["):
+            return json.loads(value)
+        return [v.strip() for v in value.split(",") if v.strip()]
+    return values
+
+def _flag(value):
+    # JSON booleans, or "true" / "1" from form fields and query strings
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+def parse_generate_request(data):
+    """
+    Read the /generate parameters from a request body.
+    Base64 images are decoded here, once; every provider call gets the same ImageHandle.
     Note: API keys are accepted from the request but are never logged or stored.
     They are only used for the API calls and then discarded.
     """
-    data = request.json
-    try:
-        image = data.get("image")
-        prompt = data.get("prompt")
-        num_trials = int(data.get("numTrials"))
-        models = data.get("selectedModels")
-        variation_type = data.get("promptVariation")
-        source = data.get("source")
+    image = data.get("image")
+    if data.get("source") == "base64" and isinstance(image, str):
+        image = imaging.ImageHandle.from_data_url(image)
+    num_trials = data.get("numTrials")
+    if num_trials is None and data.get("runId"):
+        # extending a run without more trials
+        num_trials = 0
+    params = {
+        "image": image,
+        "prompt": data.get("prompt"),
+        "num_trials": int(num_trials),
+        "models": data.get("selectedModels"),
+        "variation_type": data.get("promptVariation"),
+        "source": data.get("source"),
+        # reuse cached descriptions unless the client asks for fresh samples
+        "use_cache": not _flag(data.get("bypassCache", False)),
+        "summary_mode": data.get("summaryMode") or "single",
+        # include a per-stage timing breakdown in the response
+        "timings": _flag(data.get("timings", False)),
+        # summary renderings to compute and send; all of them by default
+        "views": data.get("views"),
+        # send each distinct prompt once, with descriptions referring to it by index
+        "compact": _flag(data.get("compact", False)),
         # user_id = data.get("userId")
-        
+
         # Get API keys from request (user-provided keys)
         # These are optional - if not provided, backend will use env vars
-        api_keys = {
+        "api_keys": {
             "openai": data.get("openaiKey"),
             "gemini": data.get("geminiKey"),
             "claude": data.get("claudeKey")
-        }
+        },
+    }
+    if params["summary_mode"] not in pipeline.SUMMARY_MODES:
+        raise ValueError(f"summaryMode must be one of {', '.join(pipeline.SUMMARY_MODES)}")
+    if isinstance(params["views"], str):
+        params["views"] = _list_field([params["views"]])
+    if params["views"] is not None:
+        unknown = [view for view in params["views"] if view not in pipeline.SUMMARY_VIEWS]
+        if unknown:
+            raise ValueError(f"views must be among {', '.join(pipeline.SUMMARY_VIEWS)}")
+        params["views"] = sorted(set(params["views"]), key=pipeline.SUMMARY_VIEWS.index)
+    if data.get("runId"):
+        # add the requested models and trials to an earlier run; its image and prompt are kept
+        params = runs.extend(params, data["runId"])
+    return params
+
+@app.route('/generate', methods=['POST',])
+def generate_descriptions():
+    """
+    API endpoint to generate descriptions from different models
+    Note: API keys are accepted from the request but are never logged or stored.
+    They are only used for the API calls and then discarded.
+    """
+    try:
+        params = parse_generate_request(read_generate_request())
+    except runs.RunNotFound as e:
+        return jsonify({"error": str(e)}), 404
     except Exception as e:
         return jsonify({"error": str(e)}), 400
     
@@ -83,19 +200,147 @@ def generate_descriptions():
     #     json.dump(metadata_safe, f, indent=4)
 
 
-    descriptions = pipeline.variation_generation(
-        image, num_trials, models, variation_type, prompt, output_path=None, source=source, api_keys=api_keys
-    )
-
-    variation_summary = pipeline.aggregated_description_generation(
-        descriptions, None, num_trials, models, api_keys
-    )
+    with tracing.request("/generate") as trace:
+        # identical requests already running share their pipeline with this one
+        events = coalescing.stream(coalescing.request_key(params), lambda: pipeline.streamed_generation(
+            params["image"], params["num_trials"], params["models"], params["variation_type"], params["prompt"],
+            source=params["source"], api_keys=params["api_keys"], use_cache=params["use_cache"],
+            summary_mode=params["summary_mode"], views=params["views"], known=params.get("known")
+        ))
+        descriptions, variation_summary, run_id = pipeline.collect_events(events)
   
     # folder_name = helper.uuid_gen()  # Commented out since file storage is disabled
-    return jsonify({"descriptions": descriptions, "imageId": None, "variationSummary": variation_summary}), 200
+    response = {"descriptions": descriptions, "imageId": None, "runId": run_id, "variationSummary": variation_summary}
+    if params["compact"]:
+        response["prompts"], response["descriptions"] = pipeline.compact_descriptions(descriptions)
+    if params["timings"]:
+        response["timings"] = trace.breakdown()
+    return jsonify(response), 200
+
+@app.route('/generate/stream', methods=['POST',])
+def generate_descriptions_stream():
+    """
+    Streaming variant of /generate using Server-Sent Events.
+    Emits a "description" event per provider call as it completes, then "preview" with
+    a local summary (unless summaryMode is "local"), then "model_diff"
+    with the variation-aware summary, then "analysis" with similarity/uniqueness/disagreement,
+    then "done" with the runId (and the timing breakdown if "timings" was requested).
+    Failures after the stream has started are sent as an "error" event.
+    """
+    try:
+        params = parse_generate_request(read_generate_request())
+    except runs.RunNotFound as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+    def events():
+        try:
+            with tracing.request("/generate/stream") as trace:
+                for event, payload in coalescing.stream(coalescing.request_key(params, preview=True), lambda: pipeline.streamed_generation(
+                    params["image"], params["num_trials"], params["models"], params["variation_type"], params["prompt"],
+                    source=params["source"], api_keys=params["api_keys"], use_cache=params["use_cache"],
+                    summary_mode=params["summary_mode"], preview=True, views=params["views"],
+                    known=params.get("known")
+                )):
+                    if event == "done" and params["timings"]:
+                        payload = dict(payload, timings=trace.breakdown())
+                    yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(events()), mimetype="text/event-stream", headers=headers)
+
+@app.route('/jobs', methods=['POST',])
+def create_job():
+    """
+    Asynchronous variant of /generate: accepts the same body, queues the run and
+    returns a job id right away. Returns 429 when the job queue is full.
+    """
+    try:
+        params = parse_generate_request(read_generate_request())
+    except runs.RunNotFound as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+    job_id = jobs.submit_job(params)
+    if job_id is None:
+        return jsonify({"error": "Too many jobs in progress, try again later"}), 429, {"Retry-After": "10"}
+    return jsonify({"jobId": job_id, "status": "queued"}), 202
+
+@app.route('/jobs/<job_id>', methods=['GET',])
+def get_job(job_id):
+    """
+    API endpoint returning a job's status, the descriptions generated so far
+    and the variation summary once available
+    """
+    job = jobs.get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job), 200
+
+@app.route('/stats', methods=['GET',])
+def get_stats():
+    """
+    API endpoint exposing cache hit/miss counters, job counts, provider rate limits,
+    hedging, circuit breaker state, this worker's admission counters, coalesced requests,
+    response compression, stored runs and the provider cassette
+    """
+    return jsonify({
+        "cache": cache.stats(),
+        "jobs": jobs.stats(),
+        "rate_limits": ratelimit.stats(),
+        "hedging": hedging.stats(),
+        "breakers": breaker.stats(),
+        "admission": admission.stats(),
+        "coalescing": coalescing.stats(),
+        "compression": compression.stats(),
+        "runs": runs.stats(),
+        "cassette": cassette.stats(),
+    }), 200
+
+@app.route('/healthz', methods=['GET',])
+def healthz():
+    """
+    Liveness check: the worker process is up
+    """
+    return jsonify({"status": "ok"}), 200
+
+@app.route('/readyz', methods=['GET',])
+def readyz():
+    """
+    Readiness check: 503 while the worker is draining or at its in-flight request cap
+    """
+    stats = admission.stats()
+    if not admission.ready():
+        return jsonify(dict(stats, status="unavailable")), 503
+    return jsonify(dict(stats, status="ready")), 200
+
+@app.route('/metrics', methods=['GET',])
+def get_metrics():
+    """
+    Prometheus endpoint with stage and provider call latencies, retries and token usage
+    """
+    exposition = tracing.exposition()
+    if exposition is None:
+        return jsonify({"error": "prometheus-client is not installed"}), 501
+    body, content_type = exposition
+    return Response(body, headers={"Content-Type": content_type}), 200
+
+def shutdown(timeout):
+    """
+    Stop admitting requests, then wait for in-flight requests and background jobs,
+    and with them their provider calls, to finish.
+    Args:
+        timeout (float): Seconds to wait at most
+    """
+    deadline = time.monotonic() + timeout
+    admission.drain(timeout)
+    jobs.drain(max(0.0, deadline - time.monotonic()))
 
 if __name__ == '__main__':
-    import os
     port = int(os.environ.get('PORT', 8000))
     debug = os.environ.get('FLASK_ENV') == 'development'
     app.run(debug=debug, host='0.0.0.0', port=port)
@@ -0,0 +1,304 @@
+# local stand-in for the OpenAI, Anthropic and Gemini APIs, for benchmarks and offline runs
+#
+#   python mock_providers.py [--port 8900] [--latency 0.8] [--sigma 0.5] [--error-rate 0.01] [--throttle-rate 0.01]
+#
+# Point the backend at it with:
+#   OPENAI_BASE_URL=http://127.0.0.1:8900/v1
+#   CLAUDE_BASE_URL=http://127.0.0.1:8900/v1/  ANTHROPIC_BASE_URL=http://127.0.0.1:8900
+#   GEMINI_BASE_URL=http://127.0.0.1:8900/v1beta/  GEMINI_NATIVE_BASE_URL=http://127.0.0.1:8900
+#
+# Latencies are log-normal around --latency seconds. Responses are canned from the
+# descriptions and summaries in frontend/public/examples.
+import os
+import io
+import sys
+import glob
+import json
+import math
+import time
+import uuid
+import random
+import argparse
+import threading
+
+from flask import Flask, Response, request, jsonify
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "frontend", "public", "examples")
+
+
+class MockConfig:
+    """
+    Latency distribution and failure rates of the mock providers.
+    """
+
+    def __init__(self, latency=0.8, sigma=0.5, error_rate=0.0, throttle_rate=0.0, seed=None):
+        self.latency = latency
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self):
+        """
+        Returns:
+            tuple: (seconds to wait, HTTP status to answer with)
+        """
+        with self._lock:
+            seconds = self.latency * math.exp(self._random.gauss(0, self.sigma)) if self.latency else 0.0
+            roll = self._random.random()
+        if roll < self.throttle_rate:
+            return seconds / 10, 429
+        if roll < self.throttle_rate + self.error_rate:
+            return seconds, 500
+        return seconds, 200
+
+    def choice(self, options):
+        with self._lock:
+            return self._random.choice(options)
+
+
+def load_canned(examples_dir=EXAMPLES_DIR):
+    """
+    Args:
+        examples_dir (str): Directory with one folder per example
+    Returns:
+        dict: {"descriptions": {model: [str]}, "summaries": [str], "analyses": [dict]}
+    """
+    canned = {"descriptions": {}, "summaries": [], "analyses": []}
+    for path in sorted(glob.glob(os.path.join(examples_dir, "*", "descriptions.json"))):
+        with open(path) as f:
+            for k, v in json.load(f).items():
+                if k != "prompt":
+                    canned["descriptions"].setdefault(v["model"], []).append(v["description"])
+    for path in sorted(glob.glob(os.path.join(examples_dir, "*", "summary.json"))):
+        with open(path) as f:
+            summary = json.load(f)
+        canned["summaries"].append(summary["model_diff"])
+        canned["analyses"].append({k: summary[k] for k in ("similarity", "uniqueness", "disagreement")})
+    if not canned["summaries"]:
+        canned["summaries"].append("- The image shows an object (1 of 1 GPT).")
+        canned["analyses"].append({"similarity": "", "uniqueness": "", "disagreement": ""})
+    return canned
+
+
+def _model_family(model):
+    for family in ("gpt", "claude", "gemini"):
+        if family in (model or ""):
+            return family
+    return "gpt"
+
+
+def _text_of(messages):
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        else:
+            parts.extend(part.get("text", "") for part in content or [] if isinstance(part, dict))
+    return "\n".join(parts)
+
+
+def _has_image(messages):
+    return any(
+        isinstance(part, dict) and part.get("type") in ("image_url", "image")
+        for message in messages if isinstance(message.get("content"), list)
+        for part in message["content"]
+    )
+
+
+def create_app(config, canned=None):
+    """
+    Args:
+        config (MockConfig): Latency and failure settings
+        canned (dict, optional): Canned responses, see load_canned
+    Returns:
+        Flask: The mock provider app
+    """
+    canned = canned or load_canned()
+    app = Flask(__name__)
+    counters = {"requests": 0, "throttled": 0, "errors": 0}
+    counters_lock = threading.Lock()
+
+    def count(name):
+        with counters_lock:
+            counters[name] += 1
+
+    def simulate():
+        # returns an error response to send, or None to answer normally
+        count("requests")
+        seconds, status = config.sample()
+        time.sleep(seconds)
+        if status == 429:
+            count("throttled")
+            response = jsonify({"error": {"message": "Rate limit exceeded (mock)", "type": "rate_limit_error", "code": 429}})
+            response.headers["Retry-After"] = "0.2"
+            return response, 429
+        if status != 200:
+            count("errors")
+            return jsonify({"error": {"message": "Internal error (mock)", "type": "server_error", "code": status}}), status
+        return None
+
+    def description(model):
+        family = _model_family(model)
+        return config.choice(canned["descriptions"].get(family) or canned["descriptions"].get("gpt") or ["An image."])
+
+    def chat_reply(body):
+        messages = body.get("messages", [])
+        text = _text_of(messages)
+        if (body.get("response_format") or {}).get("type") == "json_object":
+            if any(m.get("role") == "system" for m in messages):
+                # gpt4o_wrapper's similarity / uniqueness / disagreement analysis
+                return json.dumps(config.choice(canned["analyses"]))
+            # prompt paraphrase / persona variation
+            count_match = [int(w) for w in text.split()[:4] if w.isdigit()]
+            n = count_match[0] if count_match else 2
+            return json.dumps({str(i): f"Variation {i}: describe the image in detail." for i in range(1, n + 1)})
+        if _has_image(messages):
+            return description(body.get("model"))
+        return config.choice(canned["summaries"])
+
+    def usage(prompt_text, reply):
+        return len(prompt_text) // 4 + 1, len(reply) // 4 + 1
+
+    @app.route("/v1/chat/completions", methods=["POST"])
+    @app.route("/v1beta/chat/completions", methods=["POST"])
+    @app.route("/v1beta/openai/chat/completions", methods=["POST"])
+    def chat_completions():
+        error = simulate()
+        if error:
+            return error
+        body = request.get_json(force=True)
+        reply = chat_reply(body)
+        prompt_tokens, completion_tokens = usage(_text_of(body.get("messages", [])), reply)
+        return jsonify({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+    @app.route("/v1/messages", methods=["POST"])
+    def anthropic_messages():
+        error = simulate()
+        if error:
+            return error
+        body = request.get_json(force=True)
+        reply = description(body.get("model")) if _has_image(body.get("messages", [])) else config.choice(canned["summaries"])
+        input_tokens, output_tokens = usage(_text_of(body.get("messages", [])), reply)
+        return jsonify({
+            "id": f"msg_{uuid.uuid4().hex}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model"),
+            "content": [{"type": "text", "text": reply}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens},
+        })
+
+    @app.route("/<version>/models/<model>:generateContent", methods=["POST"])
+    def gemini_generate_content(version, model):
+        error = simulate()
+        if error:
+            return error
+        body = request.get_json(force=True)
+        parts = [p for c in body.get("contents", []) for p in c.get("parts", [])]
+        has_image = any("inlineData" in p or "inline_data" in p or "fileData" in p for p in parts)
+        reply = description("gemini") if has_image else config.choice(canned["summaries"])
+        return jsonify({
+            "candidates": [{"content": {"role": "model", "parts": [{"text": reply}]}, "finishReason": "STOP", "index": 0}],
+            "usageMetadata": {"promptTokenCount": 258, "candidatesTokenCount": len(reply) // 4 + 1},
+            "modelVersion": model,
+        })
+
+    @app.route("/v1/models", methods=["GET"])
+    @app.route("/v1beta/models", methods=["GET"])
+    def list_models():
+        return jsonify({"object": "list", "data": []})
+
+    @app.route("/image.png", methods=["GET"])
+    def image():
+        # a small image for benchmarking the URL download path
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new("RGB", (1024, 768), (120, 160, 200)).save(buffer, format="PNG")
+        return Response(buffer.getvalue(), mimetype="image/png", headers={"ETag": '"mock-image"'})
+
+    @app.route("/mock/stats", methods=["GET"])
+    def stats():
+        with counters_lock:
+            return jsonify(dict(counters))
+
+    return app
+
+
+def serve(config, host="127.0.0.1", port=0):
+    """
+    Start the mock providers in a background thread.
+    Args:
+        config (MockConfig): Latency and failure settings
+        host (str): Interface to listen on
+        port (int): Port to listen on, 0 for any free port
+    Returns:
+        tuple: (server, base url); call server.shutdown() to stop it
+    """
+    from werkzeug.serving import make_server
+
+    server = make_server(host, port, create_app(config), threaded=True)
+    thread = threading.Thread(target=server.serve_forever, name="mock-providers", daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+def environment(base_url):
+    """
+    Args:
+        base_url (str): Base url of a running mock server
+    Returns:
+        dict: Environment variables that point the backend at the mock server
+    """
+    return {
+        "OPENAI_BASE_URL": f"{base_url}/v1",
+        "CLAUDE_BASE_URL": f"{base_url}/v1/",
+        "ANTHROPIC_BASE_URL": base_url,
+        "GEMINI_BASE_URL": f"{base_url}/v1beta/",
+        "GEMINI_NATIVE_BASE_URL": base_url,
+        "OPENAI_API_KEY": "mock-key",
+        "CLAUDE_API_KEY": "mock-key",
+        "GEMINI_API_KEY": "mock-key",
+        # the mock serves its test image from localhost
+        "IMAGE_FETCH_ALLOW_PRIVATE": "1",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI / Anthropic / Gemini APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.8, help="median response time in seconds")
+    parser.add_argument("--sigma", type=float, default=0.5, help="spread of the log-normal latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 500 responses")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of 429 responses")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = MockConfig(args.latency, args.sigma, args.error_rate, args.throttle_rate, args.seed)
+    server, base_url = serve(config, args.host, args.port)
+    for key, value in environment(base_url).items():
+        print(f"{key}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,24 +7,39 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
-import re
 import json
 import helper
 import prompts
-from generation import get_all_descriptions
+import cache
+import runtime
+from generation import get_all_descriptions, stream_descriptions
 import extraction
-from concurrent.futures import ThreadPoolExecutor
+import annotations
+import local_aggregation
+import tracing
+import runs
 
-def variation_generation(image, num_trials, models, variation_type, prompt=None, output_path=None, source=None, api_keys=None):
+# "single": one gemini_thinking call over all descriptions
+# "mapreduce": per-model partial summaries as each model finishes, then a merge call
+# "local": sentence clustering on the CPU, no LLM calls
+SUMMARY_MODES = ("single", "mapreduce", "local")
+
+# renderings of the variation-aware summary a client can ask for
+SUMMARY_VIEWS = ("model_diff", "var_only", "percentage", "nl", "structured")
+# renderings returned when a client does not ask for any: the ones the frontend shows
+DEFAULT_VIEWS = SUMMARY_VIEWS[:4]
+
+def variation_generation(image, num_trials, models, variation_type, prompt=None, output_path=None, source=None, api_keys=None, use_cache=True):
     """
     Process an image to generate and break down descriptions into atomic facts.
     
     Args:
-        image (str): URL or base64-encoded image
+        image (imaging.ImageHandle | str): The image, its URL or a base64 data URL
         prompt (str, optional): Custom prompt for description. Defaults to "Describe the image in detail."
         output_path (str, optional): Path to save the output JSON. Defaults to timestamp-based filename.
-        source (str, optional): Source type of the image ('url' or 'base64')
+        source (str, optional): Source type of the image ('url', 'base64' or 'upload')
         api_keys (dict, optional): Dictionary with API keys {'openai': str, 'gemini': str, 'claude': str}
+        use_cache (bool, optional): Reuse cached descriptions. Set to False for fresh samples.
     
     Returns:
         dict: Processed results containing descriptions and atomic facts
@@ -34,7 +49,7 @@ def variation_generation(image, num_trials, models, variation_type, prompt=None,
         prompt = "Describe the image in detail."
 
     # Generate and process descriptions
-    output = get_all_descriptions(image, prompt, num_trials, models, variation_type, source, api_keys)
+    output = get_all_descriptions(image, prompt, num_trials, models, variation_type, source, api_keys, use_cache)
 
     # Save the result to a json file
     # if output_path is None:
@@ -48,7 +63,7 @@ def variation_generation(image, num_trials, models, variation_type, prompt=None,
     #     json.dump(output, f, indent=4)
     return output
 
-def aggregated_description_generation(descs, output_path, num_trials, models, api_keys=None):
+def aggregated_description_generation(descs, output_path, num_trials, models, api_keys=None, summary_mode="single", views=None):
     """
     Generate aggregated description from atomic facts.
     
@@ -58,86 +73,295 @@ def aggregated_description_generation(descs, output_path, num_trials, models, ap
         num_trials (int): Number of trials
         models (list): List of models used
         api_keys (dict, optional): Dictionary with API keys {'openai': str, 'gemini': str, 'claude': str}
+        summary_mode (str, optional): "single" (one gemini_thinking call), "mapreduce"
+            (per-model partial summaries merged by a final call) or "local" (no LLM calls)
+        views (list, optional): Summary renderings to return (see SUMMARY_VIEWS); DEFAULT_VIEWS by default
     Returns:
         dict: Processed results containing various aggregated descriptions
     """
-    summary = {}
+    # identical descriptions were summarized before: skip both LLM round-trips
+    key = cache.summary_key(descs, num_trials, models, summary_mode)
+    cached = cache.summary_cache.get(key)
+    if cached is not None:
+        summary = select_views(render_summary_views(cached["model_diff"], num_trials, models, views), views)
+        summary.update(cached["analysis"])
+        return summary
+
+    if summary_mode == "local":
+        summary, analysis = local_summary_generation(descs, num_trials, models, views)
+    else:
+        if summary_mode == "mapreduce":
+            summary = mapreduce_summary_generation(descs, num_trials, models, api_keys, views=views)
+        else:
+            summary = variation_summary_generation(descs, num_trials, models, api_keys, views)
+        analysis = uniqueness_generation(summary["model_diff"], api_keys)
+    cache.summary_cache.set(key, {"model_diff": summary["model_diff"], "analysis": analysis})
+    summary = select_views(summary, views)
+    summary.update(analysis)
 
+    # with open(f"{output_path}/summary.json", "w") as f:
+    #     json.dump(summary, f, indent=4)
+    # logger.info(f"Output saved to {output_path}/summary.json")
+    return summary
+
+def variation_summary_generation(descs, num_trials, models, api_keys=None, views=None):
+    """
+    Generate the variation-aware summary and its renderings.
+    
+    Args:
+        descs (dict): Descriptions generated by get_all_descriptions
+        num_trials (int): Number of trials
+        models (list): List of models used
+        api_keys (dict, optional): Dictionary with API keys {'openai': str, 'gemini': str, 'claude': str}
+        views (list, optional): Renderings to build, see render_summary_views
+    Returns:
+        dict: {"model_diff", "var_only", "percentage", "nl", "structured"}
+    """
     # remove the prompt field in the description
     descs = {k: v for k, v in descs.items() if k != "prompt"}
 
     desc_str = json.dumps(descs, indent=4)
     logger.info(f"Generating variation-aware summary")
 
-    aggregated_output = extraction.gemini_thinking(desc_str, num_trials, models, api_keys)
+    with tracing.span("summary", mode="single"):
+        aggregated_output = extraction.gemini_thinking(desc_str, num_trials, models, api_keys)
     logger.info(f"Calculating diff summary")
+    return render_summary_views(aggregated_output, num_trials, models, views)
+
+def start_partial_summary(entries, num_trials, model, api_keys=None):
+    """
+    Start the map step for one model's descriptions on the shared runtime loop.
+    
+    Args:
+        entries (dict): The model's descriptions, keyed by id
+        num_trials (int): Number of trials
+        model (str): The model that generated the descriptions
+        api_keys (dict, optional): Dictionary with API keys {'openai': str, 'gemini': str, 'claude': str}
+    Returns:
+        concurrent.futures.Future: Resolves to the model's annotated fact list
+    """
+    desc_str = json.dumps(entries, indent=4)
+
+    async def partial_summary():
+        with tracing.span("partial_summary", model=model):
+            return await extraction.gemini_partial_summary_async(desc_str, num_trials, model, api_keys)
+
+    return runtime.submit(partial_summary())
+
+def mapreduce_summary_generation(descs, num_trials, models, api_keys=None, partials=None, views=None):
+    """
+    Generate the variation-aware summary from per-model partial summaries.
+    
+    Args:
+        descs (dict): Descriptions generated by get_all_descriptions
+        num_trials (int): Number of trials
+        models (list): List of models used
+        api_keys (dict, optional): Dictionary with API keys {'openai': str, 'gemini': str, 'claude': str}
+        partials (dict, optional): model -> future from start_partial_summary, for models
+            whose map step already started; the rest are started here in parallel
+        views (list, optional): Renderings to build, see render_summary_views
+    Returns:
+        dict: {"model_diff", "var_only", "percentage", "nl", "structured"}
+    """
+    partials = dict(partials or {})
+    for m in models:
+        if m not in partials:
+            entries = {k: v for k, v in descs.items() if k != "prompt" and v.get("model") == m}
+            partials[m] = start_partial_summary(entries, num_trials, m, api_keys)
+    logger.info("Merging per-model summaries")
+    texts = {m: partials[m].result() for m in models}
+    with tracing.span("summary", mode="mapreduce"):
+        aggregated_output = runtime.run(extraction.gemini_merge_async(texts, num_trials, models, api_keys))
+    return render_summary_views(aggregated_output, num_trials, models, views)
+
+def local_summary_generation(descs, num_trials, models, views=None):
+    """
+    Generate the variation-aware summary and analysis without any LLM call.
+    
+    Args:
+        descs (dict): Descriptions generated by get_all_descriptions
+        num_trials (int): Number of trials
+        models (list): List of models used
+        views (list, optional): Renderings to build, see render_summary_views
+    Returns:
+        tuple: ({"model_diff", "var_only", "percentage", "nl", "structured"}, {"similarity", "uniqueness", "disagreement"})
+    """
+    with tracing.span("local_summary"):
+        claims = local_aggregation.cluster_claims(descs)
+        aggregated_output = local_aggregation.local_aggregation(claims, num_trials, models)
+        analysis = local_aggregation.local_analysis(claims, num_trials, models)
+    return render_summary_views(aggregated_output, num_trials, models, views), analysis
 
+def render_summary_views(aggregated_output, num_trials, models, views=None):
+    """
+    Render the annotated variation-aware summary in every requested representation.
     
-    def process_uniqueness_output():
-        result =  helper.gpt4o_wrapper(
+    Args:
+        aggregated_output (str): The variation-aware summary from gemini_thinking
+        num_trials (int): Number of trials
+        models (list): List of models used
+        views (list, optional): Renderings to build (see SUMMARY_VIEWS); DEFAULT_VIEWS by default.
+            "model_diff" is always included, since the analysis and the cache need it;
+            select_views drops it before the summary is returned to the client.
+    Returns:
+        dict: {"model_diff", "var_only", "percentage", "nl", "structured"}, where
+            "structured" holds the parsed claims (see annotations.parse_summary);
+            only the requested renderings are present
+    """
+    views = DEFAULT_VIEWS if views is None else views
+    summary = {"model_diff": aggregated_output}
+    if any(view in views for view in SUMMARY_VIEWS[1:]):
+        parsed = annotations.parse_summary(aggregated_output, num_trials, models)
+        summary.update(annotations.render_views(parsed, views))
+        if "structured" in views:
+            summary["structured"] = parsed
+    return summary
+
+def select_views(summary, views=None):
+    """
+    Args:
+        summary (dict): The result of render_summary_views
+        views (list, optional): Renderings the client asked for; None keeps what render_summary_views built
+    Returns:
+        dict: The summary with only the requested renderings
+    """
+    if views is None:
+        return summary
+    return {k: v for k, v in summary.items() if k in views}
+
+def compact_descriptions(descriptions):
+    """
+    Replace the prompt repeated in every description entry by an index into a prompt table.
+    
+    Args:
+        descriptions (dict): Descriptions generated by get_all_descriptions
+    Returns:
+        tuple: (prompts, descriptions), where each entry's "prompt" is an index into prompts
+    """
+    prompts = []
+    index = {}
+    compact = {}
+    for k, entry in descriptions.items():
+        prompt = entry.get("prompt")
+        if prompt not in index:
+            index[prompt] = len(prompts)
+            prompts.append(prompt)
+        compact[k] = dict(entry, prompt=index[prompt])
+    return prompts, compact
+
+def uniqueness_generation(aggregated_output, api_keys=None):
+    """
+    Summarize similarities, uniqueness and disagreements in the variation-aware summary.
+    
+    Args:
+        aggregated_output (str): The variation-aware summary from gemini_thinking
+        api_keys (dict, optional): Dictionary with API keys {'openai': str, 'gemini': str, 'claude': str}
+    Returns:
+        dict: {"similarity", "uniqueness", "disagreement"}
+    """
+    with tracing.span("analysis"):
+        result = helper.gpt4o_wrapper(
             system_prompt=prompts.unique_point_prompt, 
             user_prompt=aggregated_output, 
             system_role=True, 
             json_format=True,
             api_key=api_keys.get("openai") if api_keys else None
         )
-        # change to json format
-        result = json.loads(result)
-        return result
-    
+    # change to json format
+    result = json.loads(result)
+    return {
+        "similarity": result["similarity"],
+        "uniqueness": result["uniqueness"],
+        "disagreement": result["disagreement"],
+    }
 
-    with ThreadPoolExecutor() as executor:
-        execute_uniqueness_future = executor.submit(process_uniqueness_output)
-        uniqueness_output = execute_uniqueness_future.result()
+def streamed_generation(image, num_trials, models, variation_type, prompt=None, source=None, api_keys=None, use_cache=True, summary_mode="single", preview=False, views=None, known=None):
+    """
+    Run the full pipeline, yielding each result as soon as it is available.
+    In "mapreduce" mode, a model's partial summary starts as soon as all of its
+    trials are done, overlapping summarization with the remaining provider calls.
     
-    def convert_percentage(text):
-        models = ['gpt', 'claude', 'gemini']
-        total_mentions = 0
-        total_possible = len(models) * num_trials
-        
-        for model in models:
-            # Look for patterns like "3 of 3 GPT" and extract the first number
-            matches = re.findall(rf'(\d+) of {num_trials} *', text)
-            for match in matches:
-                total_mentions += int(match)
-        
-        if total_possible > 0:
-            percentage = (total_mentions / total_possible) * 100
-            return f"({percentage:.0f}%)"
-        return ""
-
-    def replace_parentheses(text):
-        def process_match(match):
-            inner_text = match.group(1)
-            return convert_percentage(inner_text)
-        
-        # Replace parenthesized content with percentage
-        return re.sub(r'\((.*?)\)', lambda m: process_match(m), text)
-
-    def percentage_to_nl(match):
-        text = match.group(0)
-        num = re.findall(r'\d+', text)
-        if num:
-            num = int(num[0])
-            if num >= 75:
-                return "(well-supported)"
-            elif num >= 50:
-                return "(moderately supported)"
-            elif num >= 25:
-                return "(weakly supported)"
-            else:
-                return "(very little support)"
-        return text
-
-    summary["model_diff"] = aggregated_output
-    summary["var_only"] = re.sub(r"\(.*?\)", "", aggregated_output)
-    summary["percentage"] = replace_parentheses(aggregated_output)
-    summary["nl"] = re.sub(r"\(.*?\)", percentage_to_nl, aggregated_output)
-    summary["similarity"] = uniqueness_output["similarity"]
-    summary["uniqueness"] = uniqueness_output["uniqueness"]
-    summary["disagreement"] = uniqueness_output["disagreement"]
+    Args:
+        same as variation_generation, plus summary_mode (see aggregated_description_generation)
+        preview (bool, optional): Send a local summary before the LLM summary is ready
+        views (list, optional): Summary renderings to send (see SUMMARY_VIEWS); DEFAULT_VIEWS by default
+        known (dict, optional): Descriptions of the run being extended, see runs.extend
+    Yields:
+        tuple: (event, data) with event one of
+            "description": one description entry, as soon as its provider call completes
+            "preview": the local summary, only with preview and an LLM summary mode
+            "model_diff": the variation-aware summary and its renderings
+            "analysis": similarity, uniqueness and disagreement
+            "done": the run finished, with the runId a follow-up request can extend
+    """
+    if prompt is None:
+        prompt = "Describe the image in detail."
 
-    # with open(f"{output_path}/summary.json", "w") as f:
-    #     json.dump(summary, f, indent=4)
-    # logger.info(f"Output saved to {output_path}/summary.json")
-    return summary
\ No newline at end of file
+    descriptions = {}
+    by_model = {m: {} for m in models}
+    partials = {}
+    # not a with block: the span would stay current in the consumer between yields
+    descriptions_span = tracing.start("descriptions", trials=num_trials, models=",".join(models))
+    try:
+        for i, entry in stream_descriptions(image, prompt, num_trials, models, variation_type, source, api_keys, use_cache, known):
+            descriptions[i] = entry
+            yield "description", entry
+
+            m = entry["model"]
+            by_model[m][i] = entry
+            if summary_mode == "mapreduce" and len(by_model[m]) == num_trials:
+                partials[m] = start_partial_summary(dict(sorted(by_model[m].items())), num_trials, m, api_keys)
+    except BaseException as e:
+        # also a client disconnecting mid-stream (GeneratorExit)
+        descriptions_span.end(e)
+        raise
+    descriptions_span.end()
+
+    descriptions = dict(sorted(descriptions.items()))
+    run_id = runs.save(image, prompt, num_trials, models, variation_type, source, descriptions)
+    key = cache.summary_key(descriptions, num_trials, models, summary_mode)
+    cached = cache.summary_cache.get(key)
+    if cached is not None:
+        for future in partials.values():
+            future.cancel()
+        yield "model_diff", select_views(render_summary_views(cached["model_diff"], num_trials, models, views), views)
+        yield "analysis", cached["analysis"]
+        yield "done", {"imageId": None, "runId": run_id}
+        return
+
+    if summary_mode == "local":
+        summary, analysis = local_summary_generation(descriptions, num_trials, models, views)
+        yield "model_diff", select_views(summary, views)
+    else:
+        if preview:
+            yield "preview", select_views(local_summary_generation(descriptions, num_trials, models, views)[0], views)
+        if summary_mode == "mapreduce":
+            summary = mapreduce_summary_generation(descriptions, num_trials, models, api_keys, partials, views)
+        else:
+            summary = variation_summary_generation(descriptions, num_trials, models, api_keys, views)
+        yield "model_diff", select_views(summary, views)
+        analysis = uniqueness_generation(summary["model_diff"], api_keys)
+    cache.summary_cache.set(key, {"model_diff": summary["model_diff"], "analysis": analysis})
+    yield "analysis", analysis
+    yield "done", {"imageId": None, "runId": run_id}
+
+def collect_events(events):
+    """
+    Gather the events of streamed_generation into the /generate response.
+    
+    Args:
+        events (iterable): (event, payload) pairs from streamed_generation
+    Returns:
+        tuple: (descriptions, variation_summary, run_id)
+    """
+    descriptions = {}
+    variation_summary = {}
+    run_id = None
+    for event, payload in events:
+        if event == "description":
+            descriptions[payload["id"]] = payload
+        elif event in ("model_diff", "analysis"):
+            variation_summary.update(payload)
+        elif event == "done":
+            run_id = payload["runId"]
+    return dict(sorted(descriptions.items())), variation_summary, run_id
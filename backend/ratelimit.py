@@ -0,0 +1,297 @@
+# adaptive rate limiting for provider calls, per provider and API key
+#
+# Every call to a provider goes through `await ratelimit.call(provider, api_key, make_call)`.
+# A token bucket spaces requests to the provider's requests-per-minute quota, and an
+# AIMD limit on concurrent calls grows by one per window of successes and halves on
+# 429 / 5xx responses. Retry-After headers pause the provider key until they expire.
+import os
+import time
+import random
+import asyncio
+import logging
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+
+import clients
+import hedging
+import runtime
+import tracing
+
+from dotenv import load_dotenv
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# worker processes sharing the quotas; set by gunicorn.conf.py
+SERVER_WORKERS = max(1, int(os.getenv("SERVER_WORKERS", "1")))
+# requests per minute allowed per provider key, split across the worker processes.
+# Off (0) by default: quotas differ per account tier, and a guessed one throttles calls
+# the provider would accept. 429s and Retry-After drive the limiter instead; set these
+# to the account's real quotas to stay under them up front.
+RATE_LIMIT_RPM = {
+    "openai": float(os.getenv("RATE_LIMIT_RPM_OPENAI", "0")) / SERVER_WORKERS,
+    "gemini": float(os.getenv("RATE_LIMIT_RPM_GEMINI", "0")) / SERVER_WORKERS,
+    "claude": float(os.getenv("RATE_LIMIT_RPM_CLAUDE", "0")) / SERVER_WORKERS,
+}
+# seconds of quota that may be spent in one burst
+RATE_LIMIT_BURST_SECONDS = float(os.getenv("RATE_LIMIT_BURST_SECONDS", "10"))
+# bounds of the adaptive concurrency limit per provider key
+RATE_LIMIT_INITIAL_CONCURRENCY = int(os.getenv("RATE_LIMIT_INITIAL_CONCURRENCY", "8"))
+RATE_LIMIT_MAX_CONCURRENCY = int(os.getenv("RATE_LIMIT_MAX_CONCURRENCY", "64"))
+# retries of throttled (429), server-side (5xx) and connection failures
+PROVIDER_MAX_RETRIES = int(os.getenv("PROVIDER_MAX_RETRIES", "3"))
+RETRY_BACKOFF_MAX = float(os.getenv("RETRY_BACKOFF_MAX", "30"))
+
+
+class AdaptiveLimiter:
+    """
+    Token bucket plus AIMD concurrency limit for one provider key.
+    Only used from the shared runtime loop.
+    """
+
+    def __init__(self, name, rpm, initial_concurrency, max_concurrency):
+        self.name = name
+        self.rate = rpm / 60
+        self.capacity = max(1.0, self.rate * RATE_LIMIT_BURST_SECONDS)
+        self.tokens = self.capacity
+        self.refilled = time.monotonic()
+        self.limit = float(initial_concurrency)
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        # calls started before the last decrease do not decrease the limit again
+        self.last_decrease = 0.0
+        self._condition = asyncio.Condition()
+        self.counters = {"calls": 0, "throttled": 0, "server_errors": 0, "retries": 0, "waits": 0}
+
+    def _refill(self, now):
+        if self.rate:
+            self.tokens = min(self.capacity, self.tokens + (now - self.refilled) * self.rate)
+        self.refilled = now
+
+    def _next_wait(self, now):
+        # seconds until a call may start, or None to wait for a running call to finish
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.in_flight >= int(self.limit):
+            return None
+        if not self.rate:
+            return 0
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        """
+        Wait for a token and a concurrency slot.
+        Returns:
+            float: The start time, to be passed to release
+        """
+        async with self._condition:
+            waited = False
+            while True:
+                now = time.monotonic()
+                wait = self._next_wait(now)
+                if wait == 0:
+                    break
+                waited = True
+                try:
+                    await asyncio.wait_for(self._condition.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+            if self.rate:
+                self.tokens -= 1
+            self.in_flight += 1
+            self.counters["calls"] += 1
+            if waited:
+                self.counters["waits"] += 1
+            return now
+
+    async def release(self, started, status=None, retry_after=None, cancelled=False):
+        """
+        Args:
+            started (float): The value returned by acquire
+            status (int, optional): HTTP status of a failed call; None on success
+            retry_after (float, optional): Seconds the provider asked us to wait
+            cancelled (bool): The call was cancelled or got no response, so it says nothing
+                about the provider's load
+        """
+        async with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if status is None and not cancelled:
+                # additive increase: about one more slot per limit's worth of successes
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            elif status is not None and is_overload(status):
+                self.counters["throttled" if status == 429 else "server_errors"] += 1
+                if started >= self.last_decrease:
+                    # multiplicative decrease, once per round of in-flight calls
+                    self.limit = max(1.0, self.limit / 2)
+                    self.last_decrease = now
+                    logger.info(f"{self.name}: HTTP {status}, concurrency limit now {int(self.limit)}")
+                if retry_after:
+                    self.blocked_until = max(self.blocked_until, now + retry_after)
+            self._condition.notify_all()
+
+    def saturated(self):
+        """
+        Returns:
+            bool: Whether a call starting now would have to wait
+        """
+        return self._next_wait(time.monotonic()) != 0
+
+    def stats(self):
+        """
+        Returns:
+            dict: Current limit, in-flight calls, tokens left and counters
+        """
+        stats = dict(self.counters)
+        stats["concurrency_limit"] = int(self.limit)
+        stats["in_flight"] = self.in_flight
+        stats["tokens"] = round(self.tokens, 1) if self.rate else None
+        stats["paused_seconds"] = round(max(0.0, self.blocked_until - time.monotonic()), 1)
+        return stats
+
+
+# (provider, key fingerprint) -> AdaptiveLimiter; idle limiters of user keys are evicted LRU
+_limiters = OrderedDict()
+# limiters of server (env) keys live for the whole process
+_pinned = set()
+
+
+def get_limiter(provider, api_key=None):
+    """
+    Args:
+        provider (str): "openai", "gemini" or "claude"
+        api_key (str, optional): User-supplied key. If not provided, uses env var.
+    Returns:
+        AdaptiveLimiter: The limiter shared by every call with this provider key
+    """
+    registry_key = (provider, clients.hash_key(clients.resolve_key(provider, api_key)))
+    limiter = _limiters.get(registry_key)
+    if limiter is None:
+        limiter = _limiters[registry_key] = AdaptiveLimiter(
+            f"{provider}:{registry_key[1][:8]}",
+            RATE_LIMIT_RPM.get(provider, 0),
+            RATE_LIMIT_INITIAL_CONCURRENCY,
+            RATE_LIMIT_MAX_CONCURRENCY,
+        )
+        if not api_key:
+            _pinned.add(registry_key)
+        idle = [k for k, v in _limiters.items() if v.in_flight == 0 and k != registry_key and k not in _pinned]
+        for k in idle[:max(0, len(_limiters) - len(_pinned) - clients.CLIENT_POOL_SIZE)]:
+            del _limiters[k]
+    _limiters.move_to_end(registry_key)
+    return limiter
+
+
+def is_overload(status):
+    """
+    Args:
+        status (int): HTTP status code
+    Returns:
+        bool: Whether the status means the provider is throttling or overloaded
+    """
+    return status == 429 or status >= 500
+
+
+def status_code(error):
+    """
+    Args:
+        error (Exception): An exception raised by a provider SDK
+    Returns:
+        int: The HTTP status of the failed call, or None if there was no response
+    """
+    # openai and anthropic errors carry status_code, google-genai errors carry code
+    for attribute in ("status_code", "code"):
+        value = getattr(error, attribute, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_connection_error(error):
+    """
+    Args:
+        error (Exception): An exception raised by a provider SDK
+    Returns:
+        bool: Whether the call got no response because of a connection error or timeout
+    """
+    # openai / anthropic raise APIConnectionError (and APITimeoutError under it);
+    # google-genai lets the httpx TransportError through
+    names = {cls.__name__ for cls in type(error).__mro__}
+    return isinstance(error, (ConnectionError, TimeoutError)) or bool(names & {"APIConnectionError", "TransportError"})
+
+
+def retry_after(error):
+    """
+    Args:
+        error (Exception): An exception raised by a provider SDK
+    Returns:
+        float: Seconds to wait according to the Retry-After headers, or None
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+async def call(provider, api_key, make_call):
+    """
+    Run a provider call under the provider key's limiter, retrying 429 and 5xx
+    responses with the provider's Retry-After or exponential backoff, and connection
+    errors and timeouts with exponential backoff.
+    Args:
+        provider (str): "openai", "gemini" or "claude"
+        api_key (str, optional): User-supplied key. If not provided, uses env var.
+        make_call (callable): Returns a new coroutine for each attempt
+    Returns:
+        The call's result
+    """
+    limiter = get_limiter(provider, api_key)
+    for attempt in range(PROVIDER_MAX_RETRIES + 1):
+        started = await limiter.acquire()
+        try:
+            # the global slot is only held for the attempt itself, never while this
+            # provider's limiter or backoff holds the call back
+            async with runtime.limit():
+                started = time.monotonic()
+                with hedging.attempt(limiter):
+                    result = await make_call()
+        except asyncio.CancelledError:
+            await limiter.release(started, cancelled=True)
+            raise
+        except Exception as e:
+            status = status_code(e)
+            wait = retry_after(e)
+            tracing.record_attempt(provider, time.monotonic() - started, status or "error")
+            # errors without a response (e.g. timeouts) neither grow nor shrink the limit
+            await limiter.release(started, status, wait, cancelled=status is None)
+            retryable = is_overload(status) if status is not None else is_connection_error(e)
+            if not retryable or attempt == PROVIDER_MAX_RETRIES:
+                raise
+            limiter.counters["retries"] += 1
+            tracing.record_retry(provider)
+            # the limiter holds every call back until Retry-After; jitter spreads the retries
+            await asyncio.sleep(min(RETRY_BACKOFF_MAX, wait or 0.5 * 2 ** attempt) * random.uniform(1, 1.25))
+            continue
+        tracing.record_attempt(provider, time.monotonic() - started, response=result)
+        await limiter.release(started)
+        return result
+
+
+def stats():
+    """
+    Returns:
+        dict: Limiter stats per provider key
+    """
+    return {limiter.name: limiter.stats() for limiter in list(_limiters.values())}
@@ -0,0 +1,124 @@
+# finished /generate runs, addressable by id so a follow-up request can extend them
+#
+# A run keeps its image, prompt, variation type, models, trial count and the
+# descriptions it produced (never the API keys). A request with "runId" adds models
+# or trials to it: the stored descriptions are reused, only the missing provider
+# calls are made, and the summary is computed again over the union. Extending a
+# run creates a new run; the original stays addressable until it expires.
+import os
+import uuid
+import logging
+import threading
+
+import cache
+import imaging
+from generation import description_slots
+
+from dotenv import load_dotenv
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# runs kept in memory, and their total size; each holds its image, so the size bound
+# is what limits memory when uploads are large
+RUN_STORE_SIZE = int(os.getenv("RUN_STORE_SIZE", "64"))
+RUN_STORE_MAX_BYTES = int(float(os.getenv("RUN_STORE_MB", "256")) * 1024 * 1024)
+# seconds a run can be extended after it finished
+RUN_TTL = float(os.getenv("RUN_TTL", "3600"))
+
+def _run_size(run):
+    image = run["image"]
+    size = len(image) if isinstance(image, (imaging.ImageHandle, str)) else 0
+    return size + sum(len(d["description"]) + len(d["prompt"]) for d in run["descriptions"].values())
+
+
+_runs = cache.LRUCache(RUN_STORE_SIZE, ttl=RUN_TTL, max_bytes=RUN_STORE_MAX_BYTES, sizeof=_run_size)
+_counters = {"saved": 0, "extended": 0, "reused_descriptions": 0}
+_lock = threading.Lock()
+
+
+class RunNotFound(LookupError):
+    """
+    The run id is unknown, or the run expired or was evicted.
+    """
+
+
+def save(image, prompt, num_trials, models, variation_type, source, descriptions):
+    """
+    Args:
+        image (imaging.ImageHandle | str): The image, its URL or a base64 data URL
+        prompt (str): The prompt of the run
+        num_trials (int): Number of trials
+        models (list): List of models used
+        variation_type (str): The prompt variation of the run
+        source (str): Source type of the image
+        descriptions (dict): The run's descriptions by id; failed calls are not kept
+    Returns:
+        str: The run id
+    """
+    if isinstance(image, imaging.ImageHandle):
+        # a bare copy: the base64 and data URL renderings are not worth keeping around
+        image = imaging.ImageHandle(image.data, image.media_type)
+    slots = description_slots(num_trials, models)
+    kept = {}
+    for i, entry in descriptions.items():
+        if 0 < i <= len(slots) and not entry["description"].startswith("Error:"):
+            kept[slots[i-1]] = {"description": entry["description"], "prompt": entry["prompt"]}
+    run_id = str(uuid.uuid4())
+    _runs.set(run_id, {
+        "image": image,
+        "prompt": prompt,
+        "num_trials": int(num_trials),
+        "models": list(models),
+        "variation_type": variation_type,
+        "source": source,
+        "descriptions": kept,
+    })
+    with _lock:
+        _counters["saved"] += 1
+    return run_id
+
+
+def extend(params, run_id):
+    """
+    Turn the parameters of a follow-up request into those of the extended run.
+    Args:
+        params (dict): Parsed request parameters, see main.parse_generate_request; the
+            request's models and trial count are added to the run's
+        run_id (str): The id returned with the earlier run
+    Returns:
+        dict: The parameters with the run's image, prompt and variation type, the union
+            of the models, the larger trial count and the known descriptions
+    Raises:
+        RunNotFound: The run is unknown or expired
+    """
+    run = _runs.get(run_id)
+    if run is None:
+        raise RunNotFound(f"Unknown or expired run: {run_id}")
+    params = dict(params)
+    params.update(
+        image=run["image"],
+        prompt=run["prompt"],
+        variation_type=run["variation_type"],
+        source=run["source"],
+        models=run["models"] + [m for m in params["models"] or [] if m not in run["models"]],
+        num_trials=max(run["num_trials"], params["num_trials"] or 0),
+        known=run["descriptions"],
+        run_id=run_id,
+    )
+    with _lock:
+        _counters["extended"] += 1
+        _counters["reused_descriptions"] += len(run["descriptions"])
+    return params
+
+
+def stats():
+    """
+    Returns:
+        dict: Runs stored and their size, runs saved and extended, and descriptions reused by extensions
+    """
+    with _lock:
+        stats = dict(_counters)
+    stats["stored"] = len(_runs)
+    stats["stored_bytes"] = _runs.bytes
+    return stats
@@ -0,0 +1,99 @@
+# shared asyncio runtime for provider calls
+import os
+import queue
+import asyncio
+import threading
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# global cap on in-flight provider calls across every request in this worker
+MAX_CONCURRENT_CALLS = int(os.getenv("MAX_CONCURRENT_CALLS", "256"))
+
+_loop = None
+_semaphore = None
+_lock = threading.Lock()
+
+
+def get_loop():
+    """
+    Return the long-lived event loop that runs all provider calls,
+    starting it in a daemon thread on first use.
+    Returns:
+        asyncio.AbstractEventLoop: The shared event loop
+    """
+    global _loop, _semaphore
+    with _lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="provider-loop", daemon=True)
+            thread.start()
+            _semaphore = asyncio.Semaphore(MAX_CONCURRENT_CALLS)
+            _loop = loop
+    return _loop
+
+
+def limit():
+    """
+    Returns:
+        asyncio.Semaphore: The global concurrency limit, to be used as `async with runtime.limit():`
+    """
+    get_loop()
+    return _semaphore
+
+
+def submit(coro):
+    """
+    Schedule a coroutine on the shared loop without waiting for it.
+    Args:
+        coro: The coroutine to run
+    Returns:
+        concurrent.futures.Future: Future resolving to the coroutine's result
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def run(coro):
+    """
+    Run a coroutine on the shared loop and block the calling thread until it finishes.
+    Args:
+        coro: The coroutine to run
+    Returns:
+        The coroutine's result
+    """
+    return submit(coro).result()
+
+
+def iterate(agen):
+    """
+    Drive an async generator on the shared loop and expose it as a blocking iterator.
+    Closing the iterator early cancels the async generator.
+    Args:
+        agen: The async generator to consume
+    Yields:
+        Each item produced by the async generator
+    """
+    items = queue.Queue()
+    done = object()
+
+    async def pump():
+        try:
+            async for item in agen:
+                items.put((item, None))
+        except Exception as e:
+            items.put((None, e))
+        finally:
+            await agen.aclose()
+            items.put((done, None))
+
+    future = submit(pump())
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        future.cancel()
@@ -0,0 +1,297 @@
+# timing spans for pipeline stages and provider calls
+#
+# Every stage (prompt variation, image preparation, each description call, the
+# summary and the analysis) runs in a span. Spans feed the Prometheus metrics
+# served at /metrics, optional OpenTelemetry traces (TRACING_OTEL=1) and, when a
+# request asks for it, a per-request timing breakdown.
+#
+# The current request and span live in context variables; they follow the work
+# onto the shared runtime loop, since runtime.submit and asyncio tasks copy the
+# caller's context.
+import os
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# export spans through the OpenTelemetry API; exporters are configured by the
+# deployment (e.g. opentelemetry-instrument and the OTEL_* variables)
+TRACING_OTEL = os.getenv("TRACING_OTEL", "0") == "1"
+# latency buckets in seconds, from cache hits to slow summaries
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120, 300)
+
+_request = contextvars.ContextVar("tracing_request", default=None)
+_span = contextvars.ContextVar("tracing_span", default=None)
+
+_metrics = None
+_tracer = None
+_lock = threading.Lock()
+
+
+class Span:
+    """
+    One timed stage. Attributes may be added until the span ends.
+    """
+
+    def __init__(self, stage, parent, attributes):
+        self.stage = stage
+        self.parent = parent
+        self.attributes = attributes
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.status = None
+        self.otel = _start_otel(stage, parent, attributes)
+
+    def end(self, error=None):
+        self.seconds = time.perf_counter() - self.started
+        self.status = "error" if error is not None else "ok"
+        _observe(self)
+        if self.otel is not None:
+            self.otel.set_attributes({k: v for k, v in self.attributes.items() if isinstance(v, (str, bool, int, float))})
+            if error is not None:
+                self.otel.record_exception(error)
+                from opentelemetry.trace import Status, StatusCode
+                self.otel.set_status(Status(StatusCode.ERROR, str(error)))
+            self.otel.end()
+        request = _request.get()
+        if request is not None:
+            request.add(self)
+
+
+class RequestTrace:
+    """
+    Spans recorded while serving one request.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def breakdown(self):
+        """
+        Returns:
+            dict: Total seconds, seconds and count per stage, and every span
+                with its start offset, in start order
+        """
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.started)
+        stages = {}
+        for span in spans:
+            stage = stages.setdefault(span.stage, {"count": 0, "seconds": 0.0})
+            stage["count"] += 1
+            stage["seconds"] = round(stage["seconds"] + span.seconds, 4)
+        return {
+            "total_seconds": round(time.perf_counter() - self.started, 4),
+            "stages": stages,
+            "spans": [
+                dict(span.attributes, stage=span.stage, status=span.status,
+                     start=round(span.started - self.started, 4), seconds=round(span.seconds, 4))
+                for span in spans
+            ],
+        }
+
+
+def start(stage, **attributes):
+    """
+    Start a span without making it current, for stages that do not fit a with block.
+    Args:
+        stage (str): Stage name
+        **attributes: Span attributes (model, trial, ...)
+    Returns:
+        Span: Call span.end() when the stage finishes
+    """
+    return Span(stage, _span.get(), attributes)
+
+
+@contextmanager
+def span(stage, **attributes):
+    """
+    Time a stage; provider calls made inside it are attributed to it.
+    Args:
+        stage (str): Stage name
+        **attributes: Span attributes (model, trial, ...)
+    Yields:
+        Span: The running span
+    """
+    current = start(stage, **attributes)
+    token = _span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.end(e)
+        raise
+    else:
+        current.end()
+    finally:
+        _span.reset(token)
+
+
+@contextmanager
+def request(endpoint):
+    """
+    Collect every span of one request, under a root "request" span.
+    Args:
+        endpoint (str): The route being served
+    Yields:
+        RequestTrace: Call breakdown() for the per-request timings
+    """
+    trace = RequestTrace()
+    token = _request.set(trace)
+    try:
+        with span("request", endpoint=endpoint):
+            yield trace
+    finally:
+        _request.reset(token)
+
+
+def annotate(**attributes):
+    """
+    Add attributes to the current span, if any.
+    """
+    current = _span.get()
+    if current is not None:
+        current.attributes.update(attributes)
+
+
+def usage(response):
+    """
+    Args:
+        response: A provider SDK response
+    Returns:
+        tuple: (input tokens, output tokens), None where the response does not say
+    """
+    # openai: usage.prompt/completion_tokens, anthropic: usage.input/output_tokens,
+    # google-genai: usage_metadata.prompt_token_count/candidates_token_count
+    counts = getattr(response, "usage", None)
+    if counts is not None:
+        return (getattr(counts, "prompt_tokens", None) or getattr(counts, "input_tokens", None),
+                getattr(counts, "completion_tokens", None) or getattr(counts, "output_tokens", None))
+    counts = getattr(response, "usage_metadata", None)
+    if counts is not None:
+        return getattr(counts, "prompt_token_count", None), getattr(counts, "candidates_token_count", None)
+    return None, None
+
+
+def record_attempt(provider, seconds, status=None, response=None):
+    """
+    Record one provider HTTP attempt, including retried ones.
+    Args:
+        provider (str): "openai", "gemini" or "claude"
+        seconds (float): Duration of the attempt
+        status (int | str, optional): HTTP status of a failed attempt, "error" if it got
+            no response; None for success
+        response (optional): The SDK response of a successful attempt
+    """
+    input_tokens, output_tokens = usage(response) if response is not None else (None, None)
+    current = _span.get()
+    if current is not None:
+        attributes = current.attributes
+        attributes["attempts"] = attributes.get("attempts", 0) + 1
+        if input_tokens:
+            attributes["input_tokens"] = attributes.get("input_tokens", 0) + input_tokens
+        if output_tokens:
+            attributes["output_tokens"] = attributes.get("output_tokens", 0) + output_tokens
+
+    metrics = _get_metrics()
+    if metrics is None:
+        return
+    metrics["calls"].labels(provider, "200" if status is None else str(status)).observe(seconds)
+    if input_tokens:
+        metrics["tokens"].labels(provider, "input").inc(input_tokens)
+    if output_tokens:
+        metrics["tokens"].labels(provider, "output").inc(output_tokens)
+
+
+def record_retry(provider):
+    current = _span.get()
+    if current is not None:
+        current.attributes["retries"] = current.attributes.get("retries", 0) + 1
+    metrics = _get_metrics()
+    if metrics is not None:
+        metrics["retries"].labels(provider).inc()
+
+
+def _get_metrics():
+    # prometheus_client is optional and imported on first use
+    global _metrics
+    if _metrics is None:
+        with _lock:
+            if _metrics is None:
+                try:
+                    from prometheus_client import Counter, Histogram
+                except ImportError:
+                    _metrics = {}
+                else:
+                    _metrics = {
+                        "stages": Histogram(
+                            "pipeline_stage_seconds", "Duration of pipeline stages and description calls",
+                            ["stage", "model", "path", "status"], buckets=LATENCY_BUCKETS,
+                        ),
+                        "calls": Histogram(
+                            "provider_request_seconds", "Duration of provider HTTP attempts",
+                            ["provider", "status"], buckets=LATENCY_BUCKETS,
+                        ),
+                        "retries": Counter("provider_retries_total", "Retried provider calls", ["provider"]),
+                        "tokens": Counter("provider_tokens_total", "Tokens reported by providers", ["provider", "kind"]),
+                    }
+    return _metrics or None
+
+
+def _observe(span):
+    metrics = _get_metrics()
+    if metrics is None:
+        return
+    attributes = span.attributes
+    metrics["stages"].labels(
+        span.stage, attributes.get("model", ""), attributes.get("path", ""), span.status
+    ).observe(span.seconds)
+
+
+def _start_otel(stage, parent, attributes):
+    global _tracer
+    if not TRACING_OTEL:
+        return None
+    if _tracer is None:
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            logger.warning("TRACING_OTEL is set but opentelemetry-api is not installed")
+            _tracer = False
+        else:
+            _tracer = trace.get_tracer(__name__)
+    if not _tracer:
+        return None
+    from opentelemetry import trace
+    # parents are passed explicitly: the span may end on another thread than it started
+    context = trace.set_span_in_context(parent.otel) if parent is not None and parent.otel is not None else None
+    return _tracer.start_span(stage, context=context)
+
+
+def exposition():
+    """
+    Returns:
+        tuple: (body, content type) in the Prometheus text format, or None if
+            prometheus-client is not installed
+    """
+    if _get_metrics() is None:
+        return None
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest
+
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # several worker processes: aggregate the values they write to the shared directory
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -39,13 +39,33 @@ export async function generateImageDescription(image, prompt, numTrials, selecte
              requestBody.claudeKey = claudeKey;
          }
 
-         const response = await fetch(`${BACKEND_URL}/generate`, {
-             method: 'POST',
-             headers: {
-                 'Content-Type': 'application/json',
-             },
-             body: JSON.stringify(requestBody),
-         });
+         let response;
+         if (source === 'base64') {
+             // upload local images as binary: no base64 inflation, no JSON string to parse
+             const formData = new FormData();
+             const blob = await (await fetch(image)).blob();
+             Object.entries(requestBody).forEach(([key, value]) => {
+                 if (key === 'image') {
+                     formData.append('image', blob, 'image');
+                 } else if (key === 'selectedModels') {
+                     value.forEach((model) => formData.append('selectedModels', model));
+                 } else if (key !== 'source') {
+                     formData.append(key, value);
+                 }
+             });
+             response = await fetch(`${BACKEND_URL}/generate`, {
+                 method: 'POST',
+                 body: formData,
+             });
+         } else {
+             response = await fetch(`${BACKEND_URL}/generate`, {
+                 method: 'POST',
+                 headers: {
+                     'Content-Type': 'application/json',
+                 },
+                 body: JSON.stringify(requestBody),
+             });
+         }
          const data = await response.json();
          return data;
     } catch (error) {